@@ -1,20 +1,21 @@
 # Import statments
 import board
 import busio
-import time
-import pwmio
 
 
 # Import Sound Player module. Only necessary if toy plays sounds
 from dyplayer import DYPlayer
 
 # Import all triggers used (can omit any that are not used)
-from trigger_object import TriggerObject
 from trigger_object.button_trigger import ButtonTrigger
 
 from action_object.action_sound import ActionSound
 from action_object.action_sound_sequence import ActionSoundSequence
 from action_object.action_group import ActionGroup
+from tick_clock import clock
+from scheduler import Scheduler
+from gc_scheduler import GCScheduler
+from event_log import log
 
 
 print("Code is starting")
@@ -61,29 +62,37 @@ trigger_objects      = [
                        ]
 
 
+# The scheduler sleeps between passes of the main loop until an action needs updating,
+# the player has commands to send, or it is time to scan the inputs again. It also
+# holds garbage collection off while a trigger is active and collects between triggers
+scheduler = Scheduler(trigger_objects, players=[player], collector=GCScheduler(trigger_objects))
+
 # Main loop. No need to change code here to change the number of buttons. To add new buttons, simply create new button objects
 current_trigger = None          # button corresponding to the current song or animation playing (None if no song/animation playing)
 
 while True:
+    scheduler.wait()                    # Sleep until something needs attention
+    clock.tick()                        # One time snapshot shared by all triggers and actions this pass
+
     # If a button is currently active, play its associated actions (song, animation, motor, etc...)
     if current_trigger is not None:
         if not current_trigger.play():   # Play the current trigger's actions, but check to see if they have ended
             current_trigger.stop()       # Need to actively stop the trigger to make sure it advances
             current_trigger = None
 
+    # Send any queued sound player commands and collect query responses
+    player.poll()
+
     # Update all triggers (updates debouncers)
     for trigger in trigger_objects:
-        trigger.update()
+        trigger.do_update()
 
     # check to see if the user activated any of the triggers.
     for trigger in trigger_objects:
-        if trigger.is_triggered():                                           # Was the trigger activated?
-            print("")
-            print(trigger.name, "was triggered.")
+        if trigger.check_triggered():                                        # Was the trigger activated?
+            log.info("triggered:", trigger.name)                             # Printed while the loop sleeps
             if current_trigger is not None and trigger != current_trigger:   # There is a currently a different active trigger
-                print("")                                                    # so stop that one
-                print("stopping trigger", current_trigger.name)
-                print("")
+                log.info("stopping trigger:", current_trigger.name)          # so stop that one
                 current_trigger.stop()
             trigger.respond_to_trigger()                                     # New trigger responds to activation
             if trigger.is_active():
@@ -1,7 +1,10 @@
+# Time the imports and setup so slow ones can be spotted (delete the boot lines to skip it)
+from boot_profiler import boot
+boot.install()
+
 # Import necessary libraries
 import board
 import busio
-import time
 import pwmio
 
 # Import servo motor module(library). Only necessary if toy incorporates servos. 
@@ -12,23 +15,20 @@ from dyplayer import DYPlayer                              # Debra's library
 
 # Import LED animation modules(libraries). Only necessary if toy contains LEDs
 import neopixel
+from pixel_compositor import PixelCompositor
 from adafruit_led_animation.animation.chase import Chase
 from adafruit_led_animation.animation.rainbow import Rainbow
-from adafruit_led_animation.animation.comet import Comet
-from adafruit_led_animation.animation.colorcycle import ColorCycle
 
-# Import modules(libraries) all action types used (can omit any that are not used)   # Debra's library
-from action_object.action_servo import ActionServo         
-from action_object.action_animation import ActionAnimation
-from action_object.action_sound import ActionSound
+# Actions and triggers are made by type name, so only the modules (and drivers) of the types
+# used below are imported, as the first one of each is made. Delete a type's lines and its
+# import goes with it. ActionGroup is always needed, so it is imported here      # Debra's library
+from action_object import make_action
 from action_object.action_group import ActionGroup
-
-# Import all triggers used (can omit any that are not used)                          # Debra's library
-from trigger_object import TriggerObject
-from trigger_object.button_trigger import ButtonTrigger
-from trigger_object.toggle_trigger import ToggleTrigger
-from trigger_object.ping_trigger import PingTrigger
-from trigger_object.ir_trigger import IrTrigger
+from tick_clock import clock
+from scheduler import Scheduler
+from gc_scheduler import GCScheduler
+from event_log import log
+from trigger_object import make_trigger
 
 
 
@@ -39,16 +39,20 @@ pixels = neopixel.NeoPixel(board.GP27, num_pixels, brightness = 0.2, auto_write=
 pixels.fill((0,0,0))
 pixels.show()
 
-### --- Creating objects of type animation and specifying their properties. (pixels, which was defined on line 38, is the first argument of the animation object)
+### --- The compositor owns the strip. Each animation draws on its own layer of it, and the strip is
+#  sent out at most once per pass of the main loop, however many animations are running
+compositor = PixelCompositor(pixels)
+
+### --- Creating objects of type animation and specifying their properties. (a layer of the compositor is the first argument of the animation object)
 
-chase_blue = Chase(pixels, speed=0.3, size=1, spacing=2, color=(0,0,255))  ### creating a chase object that will run an animation stored in a variable called chase_blue
-chase_red  = Chase(pixels, speed=0.3, size=1, spacing=1, color=(255,0,0))  ### creating a chase object that will run an animation stored in a variable called chase_red
-rainbow    = Rainbow(pixels, speed=0.3)                                    ### creating a rainbow object that will run an animation stored in a variable called rainbow
+chase_blue = Chase(compositor.layer(), speed=0.3, size=1, spacing=2, color=(0,0,255))  ### creating a chase object that will run an animation stored in a variable called chase_blue
+chase_red  = Chase(compositor.layer(), speed=0.3, size=1, spacing=1, color=(255,0,0))  ### creating a chase object that will run an animation stored in a variable called chase_red
+rainbow    = Rainbow(compositor.layer(), speed=0.3)                                    ### creating a rainbow object that will run an animation stored in a variable called rainbow
 
 ### --- Create animation action objects for use in ActionGroups. These action objects take an animation as their argument. The ActionAnimation is a class inside the Action_Object library Debra wrote
-chaseBlueAnimation  = ActionAnimation(chase_blue)
-rainbowAnimation    = ActionAnimation(rainbow)
-chaseRedAnimation   = ActionAnimation(chase_red)
+chaseBlueAnimation  = make_action("ActionAnimation", chase_blue)
+rainbowAnimation    = make_action("ActionAnimation", rainbow)
+chaseRedAnimation   = make_action("ActionAnimation", chase_red)
 
 ### --- End Neopixel/animation initialization
 
@@ -82,20 +86,20 @@ servo1 = servo.Servo(pwmio.PWMOut(SERVO_PIN_1, duty_cycle=2 ** 15, frequency=50)
 
 ### --- Create servo action object(s) that specifies a servo and its motion
 # Different action objects can use the same servo with different movements
-servoAction1 = ActionServo("Servo1Motion1", servo1, start_angle=20, end_angle=160, period=3)   # Wide slow steep motion
-servoAction2 = ActionServo("Servo1Motion2", servo1, start_angle=90, end_angle=120, period=1)    # Shorter faster sweep motion
+servoAction1 = make_action("ActionServo", "Servo1Motion1", servo1, start_angle=20, end_angle=160, period=3)   # Wide slow steep motion
+servoAction2 = make_action("ActionServo", "Servo1Motion2", servo1, start_angle=90, end_angle=120, period=1)    # Shorter faster sweep motion
 
 ### --- Create sound action objects to play different tracks
-songAction1 = ActionSound(player, 1)
-songAction2 = ActionSound(player, 2)
-songAction3 = ActionSound(player, 3)
-songAction4 = ActionSound(player, 4)
-songAction5 = ActionSound(player, 5)
-songAction6 = ActionSound(player, 6)
-songAction7 = ActionSound(player, 7)
-songAction8 = ActionSound(player, 8)
-songAction9 = ActionSound(player, 9)
-songAction10 = ActionSound(player, 10)
+songAction1 = make_action("ActionSound", player, 1)
+songAction2 = make_action("ActionSound", player, 2)
+songAction3 = make_action("ActionSound", player, 3)
+songAction4 = make_action("ActionSound", player, 4)
+songAction5 = make_action("ActionSound", player, 5)
+songAction6 = make_action("ActionSound", player, 6)
+songAction7 = make_action("ActionSound", player, 7)
+songAction8 = make_action("ActionSound", player, 8)
+songAction9 = make_action("ActionSound", player, 9)
+songAction10 = make_action("ActionSound", player, 10)
 
 
 ### --- Create a TriggerObject object for each trigger in the toy. Each trigger object takes a
@@ -128,20 +132,20 @@ ACTIONS_PING   = [  ActionGroup(6, songAction8, chaseBlueAnimation, servoAction2
 
 ####### Now, create trigger objects using the properties we defined above. The first property is the name, etc. 
 
-Ping1 = PingTrigger ("Ping1", board.GP14, board.GP15, 8, ACTIONS_PING, allow_restart=True)  # Sonar sensor on pins
+Ping1 = make_trigger("PingTrigger", "Ping1", board.GP14, board.GP15, 8, ACTIONS_PING, allow_restart=True)  # Sonar sensor on pins
 
 # Create button objects on Pins A and B. The "allow_restart" keyword determines what happens when the button is pushed
 # twice sequentially. If "allow_restart" is True, the next action group will start from the beginning. Otherwise all actions will stop
 # look in Debra's lib/trigger_object/button_trigger.py for arggument list
 
-ButtonA = ButtonTrigger("Button A", PIN_A, ACTIONS_A, allow_restart=True, random_actions=True)  # Button A chooses its action groups randomly
-ButtonB = ButtonTrigger("Button B", PIN_B, ACTIONS_B, allow_restart=True)                       # Button B iterates through its action groups sequentially (the default)
+ButtonA = make_trigger("ButtonTrigger", "Button A", PIN_A, ACTIONS_A, allow_restart=True, random_actions=True)  # Button A chooses its action groups randomly
+ButtonB = make_trigger("ButtonTrigger", "Button B", PIN_B, ACTIONS_B, allow_restart=True)                       # Button B iterates through its action groups sequentially (the default)
 
 # Create IR Trigger objects
-TriggerIR = IrTrigger("IR Trigger", PIN_IR, ACTIONS_IR, allow_restart=True)                     # IR Trigger craeted
+TriggerIR = make_trigger("IrTrigger", "IR Trigger", PIN_IR, ACTIONS_IR, allow_restart=True)                     # IR Trigger craeted
 
 # Create a toggle switch object. Like a button but has the "toggle_both" keyword which determines whether it triggers when flipped one way (False) or both ways (True)
-ToggleC = ToggleTrigger("Toggle C", PIN_C, ACTIONS_C, allow_restart=False, toggle_both=True)
+ToggleC = make_trigger("ToggleTrigger", "Toggle C", PIN_C, ACTIONS_C, allow_restart=False, toggle_both=True)
 
 
 # Create a list of trigger objects
@@ -152,29 +156,41 @@ trigger_objects      = [ Ping1,
                          ToggleC ]
 
 
+# The scheduler sleeps between passes of the main loop until an action needs updating,
+# the player has commands to send, or it is time to scan the inputs again. It also
+# holds garbage collection off while a trigger is active and collects between triggers,
+# and shows the LED strip once at the end of each pass
+scheduler = Scheduler(trigger_objects, players=[player], collector=GCScheduler(trigger_objects),
+                      compositors=[compositor])
+boot.mark("setup done")
+
 # Main loop. No need to change code here to change the number of buttons. To add new buttons, simply create new button objects
 current_trigger = None          # button corresponding to the current song or animation playing (None if no song/animation playing)
 
 while True:
+    scheduler.wait()                    # Sleep until something needs attention
+    clock.tick()                        # One time snapshot shared by all triggers and actions this pass
+
     # If a button is currently active, play its associated actions (song, animation, motor, etc...)
     if current_trigger is not None:
         if not current_trigger.play():   # Play the current trigger's actions, but check to see if they have ended
             current_trigger.stop()       # Need to actively stop the trigger to make sure it advances
             current_trigger = None
 
+    # Send any queued sound player commands and collect query responses
+    player.poll()
+
     # Update all triggers (updates debouncers)
     for trigger in trigger_objects:
-        trigger.update()
+        trigger.do_update()
 
     # check to see if the user activated any of the triggers.
     for trigger in trigger_objects:
-        if trigger.is_triggered():                                           # Was the trigger activated?
-            print("")
-            print(trigger.name, "was triggered.")
+        if trigger.check_triggered():                                        # Was the trigger activated?
+            boot.first_trigger()                                             # Prints the boot profile the first time
+            log.info("triggered:", trigger.name)                             # Printed while the loop sleeps
             if current_trigger is not None and trigger != current_trigger:   # There is a currently a different active trigger
-                print("")                                                    # so stop that one
-                print("stopping trigger", current_trigger.name)
-                print("")
+                log.info("stopping trigger:", current_trigger.name)          # so stop that one
                 current_trigger.stop()
             trigger.respond_to_trigger()                                     # New trigger responds to activation
             if trigger.is_active():
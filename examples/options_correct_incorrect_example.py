@@ -1,12 +1,9 @@
 # Import statments
 import board
 import busio
-import time
-import pwmio
-import random
 
 # Import servo motor module. Only necessary if toy incorporates servos
-from adafruit_motor import servo
+#from adafruit_motor import servo
 
 # Import Sound Player module. Only necessary if toy plays sounds
 from dyplayer import DYPlayer
@@ -21,9 +18,12 @@ from adafruit_led_animation.animation.rainbow import Rainbow
 from action_object.action_animation import ActionAnimation
 from action_object.action_sound import ActionSound
 from action_object.action_group import ActionGroup
+from tick_clock import clock
+from scheduler import Scheduler
+from gc_scheduler import GCScheduler
+from event_log import log
 
 # Import all triggers used (can omit any that are not used)
-from trigger_object import TriggerObject
 from trigger_object.button_trigger import ButtonTrigger
 
 
@@ -130,23 +130,33 @@ focus_trigger   = instruction_trigger   # The trigger that currently has the foc
 
 
 
+# The scheduler sleeps between passes of the main loop until an action needs updating,
+# the player has commands to send, or it is time to scan the inputs again. It also
+# holds garbage collection off while a trigger is active and collects between triggers
+scheduler = Scheduler(trigger_objects, players=[player], collector=GCScheduler(trigger_objects))
+
 # Main loop. No need to change code here to change the number of buttons. To add new buttons, simply create new button objects
 while True:
+    scheduler.wait()                    # Sleep until something needs attention
+    clock.tick()                        # One time snapshot shared by all triggers and actions this pass
+
     # If a button is currently active, play its associated actions (song, animation, motor, etc...)
     if current_trigger is not None:
         if not current_trigger.play():                       # Play the current trigger's actions, but check to see if they have ended
             current_trigger.stop()
             current_trigger = None                           # No trigger actions currently playing
 
+    # Send any queued sound player commands and collect query responses
+    player.poll()
+
     # Update all triggers (updates debouncers)
     for trigger in trigger_objects:
-        trigger.update()
+        trigger.do_update()
 
     # check to see if the user activated any of the triggers.
     for trigger in trigger_objects:                                          # Iterate over all triggers
-        if trigger.is_triggered():                                           # Was the trigger just activated?
-            print("")
-            print(trigger.name, "was triggered.")
+        if trigger.check_triggered():                                        # Was the trigger just activated?
+            log.info("triggered:", trigger.name)                             # Printed while the loop sleeps
             if current_trigger is not None:
                 if trigger == current_trigger:
                     if current_trigger.is_active():                          # if user presses the current trigger while it is
@@ -156,7 +166,7 @@ while True:
                     current_trigger.stop(set_next_action = False)                # Stop the current trigge
             current_trigger = trigger
             if current_trigger == focus_trigger:                                    # User selected the correct trigger
-                print("the correct trigger was chosen.")
+                log.info("the correct trigger was chosen")
                 is_correct_trigger = True
                 if current_trigger == instruction_trigger:
                     current_trigger.advance()
@@ -165,7 +175,7 @@ while True:
                     current_trigger.set_current_action(ACTION_CORRECT)
                     focus_trigger = instruction_trigger                         # Correct answer, next press should be instructions
             else:
-                print("expected trigger ", focus_trigger.name, " but user pressed ", current_trigger.name)
+                log.info("wrong trigger (expected, pressed):", focus_trigger.name, current_trigger.name)
                 if current_trigger.is_active():
                     current_trigger.stop()
                 current_trigger.set_current_action(ACTION_INCORRECT)
@@ -1,7 +1,6 @@
 # Import statments
 import board
 import busio
-import time
 import pwmio
 
 # Import servo motor module. Only necessary if toy incorporates servos
@@ -14,17 +13,18 @@ from dyplayer import DYPlayer
 import neopixel
 from adafruit_led_animation.animation.chase import Chase
 from adafruit_led_animation.animation.rainbow import Rainbow
-from adafruit_led_animation.animation.comet import Comet
-from adafruit_led_animation.animation.colorcycle import ColorCycle
 
 # Import modules all action types used (can omit any that are not used)
 from action_object.action_servo import ActionServo
 from action_object.action_animation import ActionAnimation
 from action_object.action_sound import ActionSound
 from action_object.action_group import ActionGroup
+from tick_clock import clock
+from scheduler import Scheduler
+from gc_scheduler import GCScheduler
+from event_log import log
 
 # Import all triggers used (can omit any that are not used)
-from trigger_object import TriggerObject
 from trigger_object.button_trigger import ButtonTrigger
 from trigger_object.toggle_trigger import ToggleTrigger
 from trigger_object.ping_trigger import PingTrigger
@@ -143,11 +143,19 @@ trigger_objects      = [ ButtonA,
 instruction_trigger = ButtonA
 
 
+# The scheduler sleeps between passes of the main loop until an action needs updating,
+# the player has commands to send, or it is time to scan the inputs again. It also
+# holds garbage collection off while a trigger is active and collects between triggers
+scheduler = Scheduler(trigger_objects, players=[player], collector=GCScheduler(trigger_objects))
+
 # Main loop. No need to change code here to change the number of buttons. To add new buttons, simply create new button objects
 current_trigger = None                  # button corresponding to the current song or animation playing (None if no song/animation playing)
 focus_trigger   = instruction_trigger   # The trigger that currently has the focus. Should initialize with instruction trigger
 
 while True:
+    scheduler.wait()                    # Sleep until something needs attention
+    clock.tick()                        # One time snapshot shared by all triggers and actions this pass
+
     # If a button is currently active, play its associated actions (song, animation, motor, etc...)
     if current_trigger is not None:
         if not current_trigger.play():                       # Play the current trigger's actions, but check to see if they have ended
@@ -157,19 +165,21 @@ while True:
                 current_trigger.stop(set_next_action=True)   #  Actively stop focus trigger to advance its action group
             current_trigger = None                           # No trigger actions currently playing
 
+    # Send any queued sound player commands and collect query responses
+    player.poll()
+
     # Update all triggers (updates debouncers)
     for trigger in trigger_objects:
-        trigger.update()
+        trigger.do_update()
 
     # check to see if the user activated any of the triggers.
     for trigger in trigger_objects:                                          # Iterate over all triggers
-        if trigger.is_triggered():                                           # Was the trigger just activated?
-            print("")
-            print(trigger.name, "was triggered.")
+        if trigger.check_triggered():                                        # Was the trigger just activated?
+            log.info("triggered:", trigger.name)                             # Printed while the loop sleeps
             if current_trigger is not None and trigger != current_trigger:   # There is a currently a different active trigger
                 current_trigger.stop(set_next_action=False)                 # Dont advance action group unless it's the right response
             if trigger == focus_trigger:                                    # User selected the correct trigger
-                print("the correct trigger was chosen.")
+                log.info("the correct trigger was chosen")
                 trigger.start()                                             # New trigger responds to activation
                 current_trigger = trigger
                 if trigger == instruction_trigger:                          # Instructions trigger activated - figure out new target/focus trigger
@@ -180,7 +190,7 @@ while True:
                     focus_trigger = instruction_trigger                     # If target was activated - set focus back to instructions trigger
                     instruction_trigger.advance()                           # Advance instructions to the next target
             else:
-                print("the wrong trigger was chosen. The correct trigger was", focus_trigger.name)
+                log.info("the wrong trigger was chosen. The correct trigger was", focus_trigger.name)
                 if focus_trigger != instruction_trigger:
                     current_trigger = instruction_trigger                   # Wrong trigger was selected, so play instructions again
                     current_trigger.start()
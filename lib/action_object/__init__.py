@@ -1,14 +1,51 @@
 #import board
 #import busio
-import time
+from tick_clock import clock, ticks_add, ticks_diff, ms
+from event_log import log
+from profiler import profiler, ACTION
+
+# Returns the earlier of two wake times (see Action.next_wake), either of which may be None
+def earliest(wake1, wake2):
+    if wake1 is None:
+        return wake2
+    if wake2 is None or wake1 < wake2:
+        return wake1
+    return wake2
+
+# Milliseconds from now until ticks, or 0 if ticks has already passed
+def ms_until(ticks):
+    wait = ticks_diff(ticks, clock.now)
+    return wait if wait > 0 else 0
 
 # A base class for peripherals (motor/animation/sound, etc...) that activate when
 # a button is pushed. Ideally expandable to a wide variety of peripherals.
 class Action:
-    def __init__(self, name=""):
+    # Priority classes. When a pass of the main loop runs over its time budget
+    # (see ActionGroup), lower priority (higher number) actions are deferred
+    PRIORITY_CRITICAL   = 0     # Never deferred, e.g. sound track switches
+    PRIORITY_MOTION     = 1     # e.g. servos
+    PRIORITY_LIGHT      = 2     # e.g. LEDs and animations
+
+    priority = PRIORITY_MOTION  # Child classes set their own class
+
+    # Instances have no __dict__ on CPython. Child classes list the attributes
+    # they add in their own __slots__
+    __slots__ = ("name", "action_start_time", "last_action_time", "max_rate", "min_interval_ms",
+                 "action_count", "rate_skips", "deferred", "frames_skipped")
+
+    # max_rate is the most times per second action() needs calling while active.
+    # do_action() skips the calls in between, so child classes don't need their
+    # own throttling. None means every call
+    def __init__(self, name="", max_rate=None):
         self.name               = name
         self.action_start_time  = -1
         self.last_action_time   = -1
+        self.max_rate           = max_rate
+        self.min_interval_ms    = ms(1 / max_rate) if max_rate else 0
+        self.action_count       = 0     # Times action() returned True since the action started
+        self.rate_skips         = 0     # Calls skipped by the rate limit since the action started
+        self.deferred           = 0     # Passes in a row this action was deferred
+        self.frames_skipped     = 0     # Total passes deferred while active
 
     # Child class may override this method with a function that is called
     # when the action is started
@@ -23,19 +60,22 @@ class Action:
     # Call this method to start action
     # Call base class method if overridden
     def start_action(self):
-        print("  starting action", self.name)
+        log.info("  starting action", self.name)
         self.on_start()
-        self.action_start_time = time.monotonic()
+        self.action_start_time = clock.now
+        self.action_count      = 0
+        self.rate_skips        = 0
 
     # Call this method to stop the action
     # Call base class method in the child
     # member function if this method is overridden
     def stop_action(self):
         if self.is_active():
-            print("  stopping action", self.name)
+            log.info("  stopping action", self.name)
             self.on_stop()
             self.action_start_time = -1
             self.last_action_time  = -1
+            self.deferred          = 0
 
     # Child class must override this method.
     # Returns true if action occurred, false if not
@@ -46,24 +86,95 @@ class Action:
     # Call this method repeatedly in the code's main loop to perform the
     # Peripheral's action repeatedly in a loop
     def do_action(self):
-        if self.action():
-            self.last_action_time = time.monotonic()
-
+        if (self.min_interval_ms and self.last_action_time >= 0
+                and ticks_diff(clock.now, self.last_action_time) < self.min_interval_ms):
+            self.rate_skips = self.rate_skips + 1
+            return
+        if profiler.enabled:
+            start = profiler.begin()
+            acted = self.action()
+            profiler.end(ACTION, self, start)
+        else:
+            acted = self.action()
+        if acted:
+            self.last_action_time = clock.now
+            self.action_count     = self.action_count + 1
+
+    # Returns the number of milliseconds until this action next needs do_action()
+    # to be called, or None if it doesn't need calling until something else changes.
+    # Used by the Scheduler to sleep between passes of the main loop. The default
+    # asks for every pass while active; child classes can override it to wake less
+    def next_wake(self):
+        if not self.is_active():
+            return None
+        if self.min_interval_ms and self.last_action_time >= 0:
+            return ms_until(ticks_add(self.last_action_time, self.min_interval_ms))
+        return 0
+
+    # Times are ticks from the shared clock (tick_clock.py), -1 when not set
     def is_active(self):
-        return (self.action_start_time > 0)
+        return (self.action_start_time >= 0)
+
+    # Returns the total time (in milliseconds) since this action was started
+    def active_ms(self):
+        return (ticks_diff(clock.now, self.action_start_time) if self.is_active() else -1)
 
     # Returns the total time (in seconds) since this action was started
     def active_duration(self):
-        return (time.monotonic() - self.action_start_time if self.is_active() else -1)
+        return (ticks_diff(clock.now, self.action_start_time) / 1000 if self.is_active() else -1)
 
-    # Returns the time (in seconds) since the last action
+    # Returns the time (in seconds) since the last action (or since the start if
+    # there hasn't been one yet)
     def time_since_last_action(self):
-        return time.monotonic() - self.action_start_time
+        last = self.last_action_time if self.last_action_time >= 0 else self.action_start_time
+        return ticks_diff(clock.now, last) / 1000
+
+    # Returns (requested, achieved) action() rates in calls per second since the
+    # action started. requested is None if the rate is not limited
+    def rate_report(self):
+        elapsed = self.active_ms()
+        achieved = self.action_count * 1000 / elapsed if elapsed > 0 else 0
+        return (self.max_rate, achieved)
+
+
+
+
+
 
 
 
 
 
+# Action types by class name, and the module each one lives in. Modules are only
+# imported (along with the drivers they need, e.g. adafruit_motor) when a type is
+# first asked for, so a toy doesn't pay the boot time and RAM of unused actions
+ACTION_TYPES = {
+    "ActionAnimation":          "action_object.action_animation",
+    "ActionGroup":              "action_object.action_group",
+    "ActionGroupConditional":   "action_object.action_group_conditional",
+    "ActionLED":                "action_object.action_led",
+    "ActionServo":              "action_object.action_servo",
+    "ActionSound":              "action_object.action_sound",
+    "ActionSoundSequence":      "action_object.action_sound_sequence",
+}
+_action_classes = {}
 
+# Returns the action class called name, importing its module on first use
+def action_type(name):
+    cls = _action_classes.get(name)
+    if cls is None:
+        if name not in ACTION_TYPES:
+            raise ValueError("unknown action type " + name)
+        module = __import__(ACTION_TYPES[name], None, None, (name,))
+        cls = getattr(module, name)
+        _action_classes[name] = cls
+    return cls
 
+# Creates an action of the type called name
+def make_action(name, *args, **kwargs):
+    return action_type(name)(*args, **kwargs)
 
+# Adds an action type defined outside this package, e.g. register_action("ActionFan", "fan_action")
+def register_action(name, module):
+    ACTION_TYPES[name] = module
+    _action_classes.pop(name, None)
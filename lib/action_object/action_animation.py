@@ -1,27 +1,48 @@
-from action_object import Action
+from action_object import Action, ms_until
+from tick_clock import ticks_add, ms
 
 from adafruit_led_animation.animation import Animation
+from pixel_compositor import PixelLayer
 
 # An action class for an LED animation
+# The animation may draw on a PixelCompositor layer instead of the strip itself, so
+# several animations can share a strip and it is only shown once per pass
 class ActionAnimation(Action):
+    priority = Action.PRIORITY_LIGHT
+    __slots__ = ("animation",)
+
     def __init__(self, animation):
         self.animation = animation
         super().__init__(name=animation.__class__.__name__)
-		
-	# Converts an animation into an object	
-	# object of the correct type
-	@staticmethod
-	def create_action(*args):
-		if len(args) == 1 and isinstance(args[0], Animation):
-			return ActionAnimation(args[0])
-		else:
-			return None
+
+    # Converts an animation into an object
+    # object of the correct type
+    @staticmethod
+    def create_action(*args):
+        if len(args) == 1 and isinstance(args[0], Animation):
+            return ActionAnimation(args[0])
+        else:
+            return None
 
     def action(self):
         return self.animation.animate()
 
+    # Next frame is due one animation speed period after the last one drawn
+    def next_wake(self):
+        if not self.is_active():
+            return None
+        if self.last_action_time < 0:
+            return 0
+        return ms_until(ticks_add(self.last_action_time, ms(self.animation.speed)))
+
     # When animation is stopped, set pixels to black and reset animation
+    # On a compositor layer, the layer is hidden instead, so animations on the
+    # layers below show through, and the strip is updated on the next render
     def on_stop(self):
         self.animation.reset()
-        self.animation.pixel_object.fill((0,0,0))
-        self.animation.pixel_object.show()
+        pixels = self.animation.pixel_object
+        if isinstance(pixels, PixelLayer):
+            pixels.clear()
+        else:
+            pixels.fill((0,0,0))
+            pixels.show()
@@ -1,31 +1,49 @@
-from action_object import Action
-import time
+from action_object import Action, earliest
+from tick_clock import clock, ticks_diff, ticks_ms, ms
+from event_log import log
+from latency_trace import tracer, STAGE_GROUP_START
 
 # Coordinates the actions of a bunch of peripherals to start/stop at the same
 # time in response to a trigger (button press or other). Currently only runs
 # for a specific amount of time (duration), but could run until a specific trigger
 # instead (to be implemented)
+#
+# Actions are updated in priority order (see Action.PRIORITY_*). If budget_ms is set
+# and the current pass of the main loop has already used that many milliseconds,
+# the remaining actions that are not PRIORITY_CRITICAL are deferred to the next pass
+# (a skipped frame), so slow animations can't delay sound and servo timing. An
+# action is never deferred more than MAX_DEFERRED passes in a row.
+#
+# If until_done is True the group also finishes as soon as every one of its actions
+# has stopped by itself (e.g. ActionSound with until_end), instead of waiting out
+# its duration. INFINITE groups always do, since nothing would ever stop them.
 class ActionGroup:
     INFINITE = -1
+    MAX_DEFERRED = 3
+    __slots__ = ("action_list", "duration", "duration_ms", "action_start_time", "data", "budget_ms", "until_done")
 
-    def __init__(self, duration, *actions):  #If duration is None, actions run until interrupted
+    def __init__(self, duration, *actions, budget_ms=None, until_done=False):  #If duration is None, actions run until interrupted
         # Validate arguments
         for a in actions:
             #print(a, type(a))
             if not isinstance(a, Action):
-                print("cannot convert ", a, " to type action")
+                log.error("cannot convert to type action:", a)
                 raise TypeError()
 
         if duration != ActionGroup.INFINITE and duration <= 0:
-            print("Duration must be a number greater than zero")
+            log.error("Duration must be a number greater than zero")
             raise ValueError()
 
         # Assign member variables
-        self.action_list        = list(actions)
+        self.action_list        = ActionGroup.by_priority(actions)
         self.duration           = duration  # Must be number (seconds) for the action to take place. TBD - add different end condition
                                             # If duration is none, the action_group plays forever until interrupted
+        self.duration_ms        = ms(duration) if duration != ActionGroup.INFINITE else ActionGroup.INFINITE
         self.action_start_time  = -1
-        self.data               = {}        # Dictionary for storing associated data (e.g. target trigger object)
+        self.data               = None      # Dictionary for storing associated data (e.g. target trigger object),
+                                            # created by the first set_data()
+        self.budget_ms          = budget_ms # Time budget (ms) for a pass of the main loop, None for no limit
+        self.until_done         = until_done or duration == ActionGroup.INFINITE
 
         #print(self.action_list)
 
@@ -35,13 +53,15 @@ class ActionGroup:
 
     # Start all the actions in the list
     def start(self):
+        if tracer.enabled:
+            tracer.stamp(STAGE_GROUP_START)
         for a in self.action_list:
             a.start_action()
-        self.action_start_time = time.monotonic()
+        self.action_start_time = clock.now
 
     # should only to call this if action_group is active
     def runtime_elapsed(self):
-        if self.duration == ActionGroup.INFINITE or time.monotonic() - self.action_start_time < self.duration:
+        if self.duration_ms == ActionGroup.INFINITE or ticks_diff(clock.now, self.action_start_time) < self.duration_ms:
             return False
         else:
             return True
@@ -54,11 +74,58 @@ class ActionGroup:
             if self.runtime_elapsed():
                 self.stop()
                 return False
+            elif self.budget_ms is None:
+                actions = self.action_list
+                for i in range(len(actions)):
+                    actions[i].do_action()
             else:
-                for a in self.action_list:
-                    a.do_action()
-                return True
+                actions = self.action_list
+                for i in range(len(actions)):
+                    a = actions[i]
+                    if (a.priority != Action.PRIORITY_CRITICAL and a.deferred < ActionGroup.MAX_DEFERRED
+                            and ticks_diff(ticks_ms(), clock.now) >= self.budget_ms):
+                        a.deferred = a.deferred + 1
+                        a.frames_skipped = a.frames_skipped + 1
+                    else:
+                        a.deferred = 0
+                        a.do_action()
+            if self.until_done and self.all_stopped():
+                self.stop()
+                return False
+            return True
+
+    # True once none of the actions is active any more
+    def all_stopped(self):
+        actions = self.action_list
+        for i in range(len(actions)):
+            if actions[i].is_active():
+                return False
+        return True
+
+    # Stable sort of actions by priority class, keeping the given order within a class
+    @staticmethod
+    def by_priority(actions):
+        ordered = []
+        for a in actions:
+            i = len(ordered)
+            while i > 0 and ordered[i-1].priority > a.priority:
+                i = i - 1
+            ordered.insert(i, a)
+        return ordered
+
 
+    # Milliseconds until the group or one of its actions next needs do_action(),
+    # or None if inactive
+    def next_wake(self):
+        if not self.is_active():
+            return None
+        wake = None
+        if self.duration_ms != ActionGroup.INFINITE:
+            wake = max(self.duration_ms - ticks_diff(clock.now, self.action_start_time), 0)
+        actions = self.action_list
+        for i in range(len(actions)):
+            wake = earliest(wake, actions[i].next_wake())
+        return wake
 
     # Stop all the actions in the list
     def stop(self):
@@ -68,8 +135,13 @@ class ActionGroup:
             self.action_start_time = -1
 
     def set_data(self, key, value):
+        if self.data is None:
+            self.data = {}
         self.data[key] = value
 
+    # Raises KeyError if key was never set
     def get_data(self, key):
+        if self.data is None:
+            raise KeyError(key)
         return self.data[key]
 
@@ -6,6 +6,8 @@ import time
 # The condition function must return a number which is the index of the list
 # of action groups to play under the current conditions
 class ActionGroupConditional(ActionGroup):
+    __slots__ = ("action_groups", "condition_fcn", "action_index", "current_action")
+
     def __init__(self, condition_fcn, action_groups):
         # Validate arguments
         self.action_groups      = action_groups
@@ -29,6 +31,9 @@ class ActionGroupConditional(ActionGroup):
         return self.current_action.do_action()
 
 
+    def next_wake(self):
+        return self.current_action.next_wake()
+
     # Stop all the actions in the list
     def stop(self):
         self.current_action.stop()
@@ -4,6 +4,9 @@ import digitalio
 
 # A simple action class for an LED that turns on for the duration of the action
 class ActionLED(Action):
+	priority = Action.PRIORITY_LIGHT
+	__slots__ = ("led",)
+
 	def __init__(self, ledPin):
 		self.led = digitalio.DigitalInOut(ledPin)
 		self.led.direction = digitalio.Direction.OUTPUT
@@ -22,3 +25,7 @@ class ActionLED(Action):
 	# but still must override this function for the class to work
 	def action(self):
 		return True
+
+	# Never needs waking once on
+	def next_wake(self):
+		return None
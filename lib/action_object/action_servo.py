@@ -1,26 +1,40 @@
 from action_object import Action
+from tick_clock import ms
 
 import math
-from adafruit_motor import servo
+
+# One period of (sin + 1) / 2, scaled to 0..SINE_SCALE, with the first entry
+# repeated at the end. Built once, so updates only do small integer arithmetic
+# and allocate nothing
+SINE_STEPS = 128
+SINE_SCALE = 1000
+_SINE = [int((math.sin(2 * math.pi * i / SINE_STEPS) + 1) * SINE_SCALE / 2 + 0.5) for i in range(SINE_STEPS + 1)]
 
 
 # An action class that controls a servo. Can specify the start/end angle and the period
 # for one complete back and forth motion
 class ActionServo(Action):
+    priority = Action.PRIORITY_MOTION
+    __slots__ = ("servo_obj", "start_angle", "end_angle", "period", "period_ms", "servo_pos")
+
     def __init__(self, name, servo_obj, start_angle=20, end_angle=160, period=3):
         self.servo_obj = servo_obj
         self.start_angle = start_angle
         self.end_angle = end_angle
         self.period = period
-        self.sevo_pos = start_angle
-        super().__init__(name=name)
+        self.period_ms = max(ms(period), 1)
+        self.servo_pos = start_angle
+        super().__init__(name=name, max_rate=20)   #Don't update TOO frequently
 
     def action(self):
-        if not self.is_active() or self.time_since_last_action() < 0.05:  #Don't update TOO frequently
+        if not self.is_active():
             return False
 
-        # Create periodic motion of the servo over the angle range with a bit of trig
-        period_frac = (math.sin(6.28*self.active_duration()/self.period) + 1)/2
-        self.servo_pos = self.start_angle + (self.end_angle - self.start_angle)*period_frac
+        # Create periodic motion of the servo over the angle range, interpolating in the sine table
+        period_ms = self.period_ms
+        phase = (self.active_ms() % period_ms) * SINE_STEPS
+        i = phase // period_ms
+        frac = _SINE[i] + (_SINE[i + 1] - _SINE[i]) * (phase % period_ms) // period_ms
+        self.servo_pos = self.start_angle + (self.end_angle - self.start_angle) * frac // SINE_SCALE
         self.servo_obj.angle = self.servo_pos
         return True
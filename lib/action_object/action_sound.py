@@ -1,26 +1,97 @@
-from action_object import Action
+from action_object import Action, earliest
+from tick_clock import ms
 
 from dyplayer import DYPlayer
+from player_pool import PlayerPool
+from latency_trace import tracer, STAGE_SOUND_START
 
 # An action class to play a track. Takes a DYPlayer object and track number
+# If a SoundManifest is given and no track_duration, the track plays for its
+# full length as listed in the manifest
+# player may also be a PlayerPool, in which case the sound gets a voice from the
+# pool each time it starts. voice_priority decides which sounds may take the voice
+# of a playing sound when the pool is full (see PlayerPool)
+# If until_end is True the action finishes on its own shortly after the track ends
+# (see DYPlayer.isPlaying), instead of running until stopped or for track_duration
+# fade_in/fade_out are the number of seconds to fade the track in when it starts and
+# out when the action stops, instead of starting and cutting off abruptly
 class ActionSound(Action):
-    def __init__(self, player, track_num, track_duration=-1):
-        self.player         = player
+    priority     = Action.PRIORITY_CRITICAL
+    END_CHECK_MS = 50       # How often to check for the end of the track in until_end mode
+    __slots__    = ("pool", "player", "track_num", "track_duration", "track_ms", "voice_priority",
+                    "until_end", "fade_in", "fade_out", "watching")
+
+    def __init__(self, player, track_num, track_duration=-1, manifest=None, voice_priority=0,
+                 until_end=False, fade_in=0, fade_out=0):
+        if track_duration < 0 and manifest is not None:
+            track_duration = manifest.duration(track_num)
+        self.pool           = player if isinstance(player, PlayerPool) else None
+        self.player         = None if self.pool is not None else player  # Voice in use if playing from a pool
         self.track_num      = track_num
         self.track_duration = track_duration    # Length of time (seconds) to play track
+        self.track_ms       = ms(track_duration) if track_duration >= 0 else -1
+        self.voice_priority = voice_priority
+        self.until_end      = until_end
+        self.fade_in        = fade_in
+        self.fade_out       = fade_out
+        self.watching       = None              # Player watched for the end of the track
         super().__init__(name="Track " + str(track_num))
 
     def on_start(self):
+        if self.pool is not None:
+            self.player = self.pool.acquire(self, self.voice_priority)
+            if self.player is None:             # Every voice is playing something more important
+                return
+        if self.fade_in > 0:
+            self.player.fadeIn(self.fade_in)        # Volume 0 goes out before the track starts
+        if tracer.enabled:
+            tracer.stamp(STAGE_SOUND_START)         # Traced up to the play command's write
         self.player.playByNumber(self.track_num)
+        if self.until_end and self.watching is None:
+            self.watching = self.player
+            self.watching.watch()
 
     def on_stop(self):
-        self.player.stop()
+        if self.watching is not None:
+            self.watching.unwatch()
+            self.watching = None
+        if self.pool is not None:
+            if self.player is not None and self.pool.owns(self, self.player):
+                self.stop_player()
+            self.pool.release(self)
+            self.player = None
+        else:
+            self.stop_player()
+
+    # Fades out in the background if fade_out is set; the player stops when the fade ends
+    def stop_player(self):
+        if self.fade_out > 0:
+            self.player.fadeOut(self.fade_out)
+        else:
+            self.player.stop()
 
     # Stop the player if the duration is specified and the song has played
     # for longer than the specified duration
     def action(self):
-        if self.track_duration >= 0 and self.active_duration() > self.track_duration:
+        if self.pool is not None and not self.pool.owns(self, self.player):  # Voice was stolen
+            self.stop_action()
+            return False
+        if self.track_ms >= 0 and self.active_ms() > self.track_ms:
+            self.stop_action()
+            return False
+        if self.until_end and not self.player.isPlaying():   # Track has ended
             self.stop_action()
             return False
         else:
             return True
+
+    # Wake when the track duration is up, and often enough to notice the track ending
+    def next_wake(self):
+        if not self.is_active():
+            return None
+        wake = None
+        if self.track_ms >= 0:
+            wake = max(self.track_ms - self.active_ms(), 0)
+        if self.until_end:
+            wake = earliest(wake, ActionSound.END_CHECK_MS)
+        return wake
@@ -1,14 +1,36 @@
-from action_object import Action
+from action_object import Action, earliest
+from tick_clock import clock, ms, ticks_add, ticks_diff
 
-from dyplayer import DYPlayer
+from dyplayer import DYPlayer, PlayMode
 
 # An action class to play a sequence of tracks in a row.
 # player is the sound player object
 # track_list is a list of tracks to play in the order specified, e.g. [3,2,4] will
 # play tracks 3, 2, and 4 in order
 # duration_list is a list containing number of seconds to play each track for, e.g. [4.5, 3, 6]
+# If duration_list is omitted, each track plays for its full length as listed in manifest
+# If device_sequence is True the player module plays the sequence by itself, using its
+# folder sequence mode, and the host only keeps track of progress. The tracks must be
+# consecutive numbers in one folder and play for their full length, so duration_list
+# must hold the real track lengths (or come from a manifest)
+# Otherwise the host switches tracks at deadlines fixed when the first track's play
+# command goes out to the module, so timing errors don't add up over the sequence. Each switch is cued on the player
+# (see DYPlayer.cueByNumber) a whole track ahead, so the player sends it on time
+# and keeps its transmit window free for it, and the next track simply replaces the
+# current one (no stop in between). With prearm the next track is selected while
+# the current one plays, so the module has it open and starts it without a gap;
+# use prearm=False for a module that stops playing when a track is selected.
+# lead_time is how many seconds early each switch is sent, to cover the time the
+# module takes to start the track. By default none for a pre-armed track and
+# START_LEAD seconds otherwise
 class ActionSoundSequence(Action):
-    def __init__(self, player, track_list, duration_list):
+    priority   = Action.PRIORITY_CRITICAL
+    START_LEAD = 0.03
+    __slots__  = ("player", "tracks", "durations", "track_stops", "track_index", "current_track_stop",
+                  "lead_ms", "prearm", "device_sequence", "saved_cycle_mode", "play_mark", "schedule_start")
+
+    def __init__(self, player, track_list, duration_list=None, manifest=None, device_sequence=False,
+                 prearm=True, lead_time=None):
 
 
         if type(track_list) is not list:
@@ -16,47 +38,131 @@ class ActionSoundSequence(Action):
         if len(track_list) < 2:
             raise ValueError("ActionSoundSequence requires two or more tracks")
 
+        if duration_list is None:
+            if manifest is None:
+                raise ValueError("specify either a duration_list or a manifest")
+            duration_list = [manifest.duration(t) for t in track_list]
 
         if type(duration_list) is not list:
             raise TypeError("parameter duration list must be a list with length > 1")
         if len(duration_list) != len(track_list):
             raise ValueError("must specify exactly one duration for each track")
+        if device_sequence:
+            for i in range(1, len(track_list)):
+                if track_list[i] != track_list[i-1] + 1:
+                    raise ValueError("device_sequence requires consecutive track numbers")
 
         self.player             = player
         self.tracks             = track_list        # List of track numbers to play sequentially in the order specified
         self.durations          = duration_list     # Length of time (seconds) to play each track. Must have the same
                                                 # number of elements as the track_list
+        self.track_stops        = []                # Time (milliseconds after start) each track ends
+        stop = 0
+        for d in duration_list:
+            stop = stop + d
+            self.track_stops.append(ms(stop))
         self.track_index        = 0
-        self.current_track_stop = self.durations[0]
+        self.current_track_stop = self.track_stops[0]
+        if lead_time is None:
+            lead_time = 0 if prearm else ActionSoundSequence.START_LEAD
+        self.lead_ms            = ms(lead_time)     # Milliseconds to send each track switch early
+        self.prearm             = prearm
+        self.device_sequence    = device_sequence
+        self.saved_cycle_mode   = None              # Player cycle mode to restore after a device sequence
+        self.play_mark          = 0                 # player.plays_sent before the first track was played
+        self.schedule_start     = -1                # Ticks the first track's play went out, -1 until then
 
 
         super().__init__(name="Tracks_" + "_".join(str(t) for t in track_list))
 
     def on_start(self):
         #print("starting track ", self.tracks[self.track_index])
+        self.play_mark      = self.player.plays_sent
+        self.schedule_start = -1
         self.player.playByNumber(self.tracks[self.track_index])  #Current track will be zero
+        self.check_started()                        # Sent right away if the transmit window was open
+        if self.device_sequence and self.saved_cycle_mode is None:
+            # Sent after the play command so it doesn't delay the first track
+            self.saved_cycle_mode = self.player.cycle_mode if self.player.cycle_mode is not None else PlayMode.ONE_OFF
+            self.player.setCycleMode(PlayMode.SEQUENCE_DIR)     # Module plays the rest of the folder and stops
+            self.player.watch()
+
+    # The first play may wait in the player's transmit queue. Once it has gone
+    # out, start the schedule from when it did and cue the first switch.
+    # Returns False while it is still waiting
+    def check_started(self):
+        if self.schedule_start >= 0:
+            return True
+        if self.player.plays_sent == self.play_mark:
+            return False
+        self.schedule_start = self.player.last_play_tx
+        if not self.device_sequence:
+            self.cue_next(self.schedule_start)
+        return True
+
+    # Milliseconds since the first track started, -1 until it has
+    def schedule_ms(self):
+        return ticks_diff(clock.now, self.schedule_start) if self.schedule_start >= 0 else -1
 
     def on_stop(self):
+        self.schedule_start     = -1
         self.track_index        = 0
-        self.current_track_stop = self.durations[0]
+        self.current_track_stop = self.track_stops[0]
         #print("stopping ", self.name, " at duration ", self.active_duration())
         self.player.stop()
+        if self.saved_cycle_mode is not None:
+            self.player.setCycleMode(self.saved_cycle_mode)
+            self.player.unwatch()
+            self.saved_cycle_mode = None
 
-    # Stop the player if the duration is specified and the song has played
-    # for longer than the specified duration
+    # Move on to the next track (or finish) when the current track's deadline arrives
     def action(self):
-        if self.active_duration() > self.current_track_stop:  #Time to stop the current track
-            self.track_index = self.track_index + 1
-            if self.track_index >= len(self.tracks):        #We have played all tracks
+        if not self.check_started():
+            return True
+        elapsed = self.schedule_ms()
+        if self.device_sequence:
+            if elapsed > self.current_track_stop:           #Player moves on by itself, just track progress
+                self.track_index = self.track_index + 1
+                if self.track_index >= len(self.tracks):    #We have played all tracks
+                    self.stop_action()
+                    return False
+                self.current_track_stop = self.track_stops[self.track_index]
+            elif not self.player.isPlaying():               #Player reached the end of the folder
                 self.stop_action()
                 return False
-            else:
-                self.player.stop()
-                #print("stopping track ", self.tracks[self.track_index - 1], " at duration ", self.active_duration())
-                self.player.playByNumber(self.tracks[self.track_index])
-                #print("starting track ", self.tracks[self.track_index])
-                self.current_track_stop = self.current_track_stop + self.durations[self.track_index]
+            return True
+
+        if self.track_index == len(self.tracks) - 1:        #Last track plays to its deadline
+            if elapsed > self.current_track_stop:
+                self.stop_action()
+                return False
+        elif elapsed >= self.current_track_stop - self.lead_ms and not self.player.isCued():
+            # The player has sent the switch to the next track
+            self.track_index = self.track_index + 1
+            self.current_track_stop = self.track_stops[self.track_index]
+            self.cue_next(self.schedule_start)
         return True
 
+    # Cue the switch from the current track to the next one on the player.
+    # start is the tick the first track started
+    def cue_next(self, start):
+        if self.track_index < len(self.tracks) - 1:
+            self.player.cueByNumber(self.tracks[self.track_index + 1],
+                                    ticks_add(start, self.current_track_stop - self.lead_ms), self.prearm)
+
+    # Wake at the next track switch (or the end of the sequence)
+    def next_wake(self):
+        if not self.is_active():
+            return None
+        if self.schedule_start < 0:                 # Waiting for the player to send the first track
+            wake = self.player.nextPollMs()
+            return wake if wake is not None else 0
+        elapsed = self.schedule_ms()
+        if self.device_sequence:
+            return earliest(max(self.current_track_stop - elapsed, 0), 50)
+        if self.track_index == len(self.tracks) - 1:
+            return max(self.current_track_stop - elapsed, 0)
+        return max(self.current_track_stop - self.lead_ms - elapsed, 0)  # Then 0 until the player has sent it
+
     def get_duration(self):
         return sum(self.durations)
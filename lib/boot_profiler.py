@@ -0,0 +1,118 @@
+# ----------------------------------------------------------------------------
+# Boot time profiler: where the time between power-on and the first trigger
+# goes.
+#
+# Import it first thing in code.py and install it. From then on every import is
+# timed, along with the heap it used, and milestones can be marked along the
+# way. On CircuitPython time.monotonic() counts from power-on, so the times are
+# since power-on; on a desktop Python they are since the profiler was imported.
+#
+#   from boot_profiler import boot
+#   boot.install()
+#   ... imports and setup ...
+#   boot.mark("setup done")
+#   ... in the main loop, when a trigger fires:
+#   boot.first_trigger()        # marks the time and prints the report once
+#
+# Nested imports are shown indented under the import that caused them; the time
+# of an import includes its nested imports. Ports that can't replace the import
+# function only get the milestones.
+#
+# License: MIT
+# ----------------------------------------------------------------------------
+
+import gc
+import sys
+import time
+
+try:
+    import builtins
+except ImportError:
+    builtins = None
+
+if hasattr(time, "monotonic_ns"):
+    def _now_ms():
+        return time.monotonic_ns() // 1000000
+else:
+    def _now_ms():
+        return int(time.monotonic() * 1000)
+
+if hasattr(gc, "mem_alloc"):
+    _heap = gc.mem_alloc
+else:
+    def _heap():
+        return 0
+
+# The board's clock already starts at power-on
+_ORIGIN_MS = 0 if sys.implementation.name in ("circuitpython", "micropython") else _now_ms()
+
+
+class BootProfiler:
+    def __init__(self):
+        self.imports        = []        # [depth, name, ms, bytes] in the order imports started
+        self.marks          = []        # (label, ms since power-on)
+        self.triggered      = False
+        self._depth         = 0
+        self._import        = None      # The import function that was replaced
+
+    # Start timing imports. Returns False if this port can't replace __import__
+    def install(self):
+        if self._import is not None:
+            return True
+        if builtins is None:
+            return False
+        original = builtins.__import__
+        try:
+            builtins.__import__ = self._timed_import
+        except (AttributeError, TypeError):
+            return False
+        self._import = original
+        return True
+
+    # Stop timing imports
+    def uninstall(self):
+        if self._import is not None:
+            builtins.__import__ = self._import
+            self._import = None
+
+    # Record a milestone
+    def mark(self, label):
+        self.marks.append((label, self.since_boot()))
+
+    # Milliseconds since power-on
+    def since_boot(self):
+        return _now_ms() - _ORIGIN_MS
+
+    # Call when a trigger fires. The first time, marks it, stops timing imports
+    # and prints the report
+    def first_trigger(self):
+        if self.triggered:
+            return
+        self.triggered = True
+        self.mark("first trigger")
+        self.uninstall()
+        self.report()
+
+    def report(self):
+        print("--- boot profile ---")
+        for depth, name, took, used in self.imports:
+            if took or used:
+                print("%6d ms %7d B  %s%s" % (took, used, "  " * depth, name))
+        for label, when in self.marks:
+            print("%6d ms since power-on: %s" % (when, label))
+
+    def _timed_import(self, name, *args):
+        entry = [self._depth, name or ".", 0, 0]     # "" for a relative import
+        self.imports.append(entry)
+        start = _now_ms()
+        heap = _heap()
+        self._depth = self._depth + 1
+        try:
+            return self._import(name, *args)
+        finally:
+            self._depth = self._depth - 1
+            entry[2] = _now_ms() - start
+            entry[3] = _heap() - heap
+
+# The profiler code.py installs
+boot = BootProfiler()
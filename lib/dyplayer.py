@@ -16,10 +16,9 @@
 #
 # ----------------------------------------------------------------------------
 
-import board
-import time
-import busio
-import struct
+from tick_clock import ticks_ms, ticks_add, ticks_diff, ticks_age_limit, ms
+from event_log import log
+from latency_trace import tracer, STAGE_UART_WRITE
 
 
 class PlayState():
@@ -38,9 +37,133 @@ class PlayMode():
     SEQUENCE_DIR    = b'\06'       # Play all sound files in current folder in sequence, and stop
     SEQUENCE        = b'\07'       # Play all sound files on device in sequence, and stop
 
+class Drive():
+    USB     = 0x00
+    SD      = 0x01
+    FLASH   = 0x02
+
 def clamp(x, minval, maxval):
     return max(min(maxval, x), minval)
 
+# A query that has been sent to the player but not yet answered. Returned right away
+# by the non-blocking query methods, and completed from DYPlayer.poll() when the
+# response arrives or the timeout expires. Check done/result each tick, or pass a
+# callback that is invoked with the query once it completes.
+class PendingQuery():
+  def __init__(self, opcode, callback=None, timeout=1.0):
+    self.opcode     = opcode      # Second byte of the query frame, echoed in the response
+    self.callback   = callback    # Optional function called as callback(query) on completion
+    self.timeout    = timeout     # Seconds to wait for a response after the query is sent
+    self.timeout_ms = ms(timeout)
+    self.sent_time  = -1          # Ticks (ms) the query was sent
+    self.generation = 0           # Player state generation when the query was made
+    self.done       = False
+    self.timed_out  = False
+    self.result     = None
+
+  def complete(self, result):
+    self.result = result
+    self.done   = True
+    if self.callback is not None:
+      self.callback(self)
+
+  def expire(self):
+    self.timed_out = True
+    self.complete(None)
+
+  # Make the query ready to be sent again, so a repeated query needs no new object
+  def reset(self, generation):
+    self.sent_time  = -1
+    self.generation = generation
+    self.done       = False
+    self.timed_out  = False
+    self.result     = None
+
+# Kinds of response frame the player sends back. The kind is the opcode of the
+# query that was answered (second byte of the frame)
+class Response():
+    PLAY_STATE          = 0x01    # value is a PlayState
+    ONLINE_DRIVE        = 0x09    # value is the drive(s) online
+    PLAY_DRIVE          = 0x0a    # value is the drive currently playing
+    NUM_SONGS           = 0x0c    # value is the number of songs on the device
+    CURRENT_SONG        = 0x0d    # value is the number of the current song
+    FOLDER_FIRST_SONG   = 0x11    # value is the number of the first song in the folder
+    FOLDER_NUM_SONGS    = 0x12    # value is the number of songs in the folder
+
+# Incremental parser for response frames (AA, kind, length, data..., checksum).
+# Bytes are fed in as they arrive from the UART, in whatever pieces they arrive,
+# and kept in a ring buffer across loop ticks. next_frame() resyncs on the 0xAA
+# header, uses the length byte to find the end of the frame, discards frames that
+# fail the checksum, and extracts one complete response at a time.
+class FrameParser():
+  HEADER      = 0xaa
+  MAX_DATA    = 8                 # Longer length bytes can only be line noise
+  RING_SIZE   = 64
+
+  def __init__(self):
+    self._ring      = bytearray(FrameParser.RING_SIZE)
+    self._head      = 0           # Index of the oldest unparsed byte
+    self._count     = 0           # Number of unparsed bytes in the ring
+    self.kind       = -1          # Kind (see Response) of the last complete frame
+    self.value      = None        # Decoded data of the last complete frame
+    self.dropped    = 0           # Bytes discarded while resyncing or on overrun
+    self.bad_frames = 0           # Frames discarded because of a bad checksum
+
+  # --- add n bytes from buf to the ring. Oldest bytes are dropped on overrun ---
+  def feed(self, buf, n):
+    ring = self._ring
+    size = FrameParser.RING_SIZE
+    for i in range(n):
+      if self._count == size:
+        self._head  = (self._head + 1) % size
+        self._count = self._count - 1
+        self.dropped = self.dropped + 1
+      ring[(self._head + self._count) % size] = buf[i]
+      self._count = self._count + 1
+
+  def _peek(self, offset):
+    return self._ring[(self._head + offset) % FrameParser.RING_SIZE]
+
+  def _discard(self, n):
+    self._head  = (self._head + n) % FrameParser.RING_SIZE
+    self._count = self._count - n
+
+  # --- extract the next complete frame into kind/value. Returns False when no
+  # complete frame is buffered yet (the partial frame stays for the next feed)
+  def next_frame(self):
+    while self._count > 0:
+      if self._peek(0) != FrameParser.HEADER:
+        self._discard(1)
+        self.dropped = self.dropped + 1
+        continue
+      if self._count < 3:
+        return False
+      length = self._peek(2)
+      if length > FrameParser.MAX_DATA:
+        self._discard(1)
+        self.dropped = self.dropped + 1
+        continue
+      total = length + 4
+      if self._count < total:
+        return False
+      val = 0
+      for i in range(total - 1):
+        val = (val + self._peek(i)) & 0xff
+      if val != self._peek(total - 1):
+        self._discard(1)              # Resync from the next header byte
+        self.bad_frames = self.bad_frames + 1
+        continue
+      self.kind = self._peek(1)
+      if length == 0:
+        self.value = None
+      elif length == 1:
+        self.value = self._peek(3)
+      else:
+        self.value = (self._peek(3) << 8) | self._peek(4)
+      self._discard(total)
+      return True
+    return False
+
 class DYPlayer(object):
 
   # --- commands from DY-SV5W datasheet)  ----------------
@@ -60,7 +183,7 @@ class DYPlayer(object):
 
   # --- control commands with parameters -------------------------------
   CMD_PLAY_BY_NUMBER = b'\xaa\x07\x02'  # +SNH +SNL (low, high bits from 0x00-0xff)
-  CMD_PLAY_BY_PATH   = b'\xaa\x08'      # +LENGTH +DRIVE +PATH (length, drive, path all from 0x00 to 0xff)
+  CMD_PLAY_BY_PATH   = b'\xaa\x08'      # +LENGTH +DRIVE +PATH (length counts the drive byte and the encoded path)
   CMD_SELECT_SONG    = b'\xaa\x1f\x02'   # +SNH +SNL (low, high bits from 0x00-0xff) (Select but don't play)
 
   # --- query commands (with return value format) --------------
@@ -75,238 +198,790 @@ class DYPlayer(object):
   # --- set commands (with parameter notes from datasheet)
   SET_VOLUME        = b'\xaa\x13\x01' # + VOL SM (vol: 0x00-0xFF)
   SET_CYCLE_MODE    = b'\xaa\x18\x01' # + LOOP-MODE SM (LOOP-MODE 0X00-0X07)
-  SET_CYCLE_TIMES   = b'\xaa\x19\x01' # + H L SM (H: 0x00-0xFF, L:0x00-0xFF)
+  SET_CYCLE_TIMES   = b'\xaa\x19\x02' # + H L SM (H: 0x00-0xFF, L:0x00-0xFF)
   SET_EQ            = b'\xaa\x01'     # + EQ SM (EQ: 0X00-0X04)
 
-  #TBD - Specified Song by Path
+
+  DEFAULT_VOLUME    = 20              # The module's volume at power up, assumed until one is set
+  _MAX_FRAME        = 8               # Longest parameterised frame built by the encoder
+  TX_QUEUE_LEN      = 8               # Frames that can wait for their transmit window
+
+  # --- what to do when a fade reaches its target volume
+  _FADE_THEN_NONE   = 0
+  _FADE_THEN_STOP   = 1               # Fade out: stop, then restore the volume
+  _FADE_THEN_PLAY   = 2               # Crossfade: play the next track and fade back in
+
+  # --- opcode classes used to coalesce queued commands
+  _TRANSPORT_OPS    = (0x02, 0x03, 0x04, 0x05, 0x06, 0x07, 0x08, 0x0e, 0x0f, 0x10)  # Change what is playing
+  _ABSOLUTE_OPS     = (0x04, 0x07, 0x08, 0x10)    # Make any earlier queued transport command pointless
+  _SETTING_OPS      = (0x13, 0x18, 0x19, 0x1f)    # Only the last value queued matters
+  _PLAY_OPS         = (0x02, 0x07, 0x08)          # Start a track
 
   # --- constructor   --------------------------------------------------------
 
-  def __init__(self,uart=None,media=None,volume=50,eq=None,latency=0.100):
+  # All times are kept internally as integer tick milliseconds (see tick_clock),
+  # so the player's bookkeeping allocates nothing once running
+  # status_interval - seconds between background status polls that correct the
+  #                   local state mirror (None disables them)
+  # num_songs_ttl, drive_ttl - seconds a cached song count/online drive stays valid
+  # path_cache_size - number of encoded path frames kept for playByPath
+  # busy_pin - board pin wired to the module's BUSY output (low while playing), if any
+  # watch_interval - seconds between play state polls while something watches for
+  #                  the end of a track and there is no BUSY pin
+  def __init__(self,uart=None,media=None,volume=50,eq=None,latency=0.100,
+               status_interval=None,num_songs_ttl=60.0,drive_ttl=60.0,path_cache_size=16,
+               busy_pin=None,watch_interval=0.25):
     if uart is None:
+      # Imported here so the driver can also run against a software UART stand-in
+      # (see dyplayer_emulator.py) on a machine without board support
+      import board
+      import busio
       self._uart = busio.UART(board.TX,board.RX,baudrate=9600)
     else:
       self._uart = uart
-    self._latency = latency
+    self._latency_ms = ms(latency)
+    self._pending = []            # Queries waiting for a response, oldest first
+    self._rx_buf  = bytearray(16)   # Scratch buffer for UART reads
+    self._parser  = FrameParser()
+
+    # Local mirror of the player state. Updated optimistically from the commands
+    # we send and corrected by query responses. None means not known yet
+    self.play_state       = None
+    self.current_song     = None
+    self.volume           = None
+    self.cycle_mode       = None
+    self._state_gen       = 0     # Bumped by every command that changes what is playing
+    self.status_interval_ms = ms(status_interval) if status_interval is not None else None
+    self._status_query    = None
+    self._last_status     = -1    # Ticks of the last status answer, -1 if none yet
+    self._status_toggle   = False
+    self._on_status       = self._status_done
+    # Status queries are reused rather than allocated for every background poll
+    self._status_play     = PendingQuery(DYPlayer.QUERY_PLAY_STATUS[1], self._on_status)
+    self._status_song     = PendingQuery(DYPlayer.QUERY_CURRENT_SONG[1], self._on_status)
+    self._last_transport  = -1    # Ticks of the last command that changed what is playing, -1 if none
+
+    # End of track detection, from the BUSY pin if wired, else from play state polls
+    if busy_pin is not None:
+      import digitalio
+      self._busy = digitalio.DigitalInOut(busy_pin)
+      self._busy.direction = digitalio.Direction.INPUT
+    else:
+      self._busy = None
+    self.busy_grace_ms    = 300   # Milliseconds after a play command before BUSY is trusted
+    self.watch_interval_ms = ms(watch_interval)
+    self._watchers        = 0
+
+    # Volume fade in progress, stepped from poll()
+    self._fading          = False
+    self._fade_from       = 0
+    self._fade_to         = 0
+    self._fade_start      = 0     # Ticks
+    self._fade_duration   = 0     # Milliseconds
+    self._fade_step_time  = 0     # Ticks
+    self._fade_then       = DYPlayer._FADE_THEN_NONE
+    self._fade_track      = 0     # Track to play when a crossfade reaches silence
+    self._fade_restore    = 0     # Volume to restore after a fade out stops the player
+
+    # Track switch cued for an exact time (see cueByNumber)
+    self._cue_song        = -1    # Track to play at _cue_at, -1 if nothing is cued
+    self._cue_at          = 0     # Ticks
+    self._cue_prearm      = False # The track is still to be selected ahead of the switch
+    self._cue_selected    = False # The track was selected, so a plain play starts it
+    self.plays_sent       = 0     # Play frames written so far
+    self.last_play_tx     = -1    # Ticks the last play frame was written, -1 if none yet
+
+    # Cached static facts with the time they were read
+    self.num_songs_ttl_ms = ms(num_songs_ttl)
+    self.drive_ttl_ms     = ms(drive_ttl)
+    self._num_songs       = None
+    self._num_songs_time  = -1
+    self._num_songs_query = None
+    self._drive           = None
+    self._drive_time      = -1
+    self._drive_query     = None
+
+    # Encoded path frames by path, oldest first in _path_order for eviction
+    self.path_cache_size  = path_cache_size
+    self._path_cache      = {}
+    self._path_order      = []
+    self._frame   = bytearray(DYPlayer._MAX_FRAME)
+    frame_view    = memoryview(self._frame)
+    self._frame_views = [frame_view[0:n] for n in range(DYPlayer._MAX_FRAME + 1)]
+
+    # Transmit queue. The module drops frames sent less than latency seconds apart,
+    # so frames that arrive inside the window wait here until poll() sends them.
+    # The window must be strictly longer than latency in whole tick milliseconds,
+    # since ticks can undercount a gap by up to one millisecond.
+    # Entries 0.._tx_count-1 are queued, oldest first. Constant frames are queued
+    # by reference, encoded frames are copied into one of the preallocated slots
+    qlen              = DYPlayer.TX_QUEUE_LEN
+    self._tx_slots    = [bytearray(DYPlayer._MAX_FRAME) for i in range(qlen)]
+    self._tx_views    = [[memoryview(slot)[0:n] for n in range(DYPlayer._MAX_FRAME + 1)] for slot in self._tx_slots]
+    self._tx_slot     = bytearray(range(qlen))   # Slot used by each queue entry
+    self._tx_frame    = [None] * qlen            # Frame to send for each queue entry
+    self._tx_op       = bytearray(qlen)          # Opcode of each queue entry
+    self._tx_query    = [None] * qlen            # PendingQuery answered by each queue entry
+    self._tx_count    = 0
+    self._last_tx     = ticks_add(ticks_ms(), -self._latency_ms - 1)
+    self.tx_dropped   = 0                        # Frames lost because the queue was full
 
   # --- transfer data to device   ---------------------------------------------
   def _write_data(self, buf):
     self._uart.write(buf)
 
-  # --- read data from device   ------------------------------------------------
-  def _read_data(self, buf):
-    index = 0
+  # --- move any bytes waiting on the UART into the response parser -----------
+  def _read_data(self):
     while self._uart.in_waiting:
-      readbuf = self._uart.read(32)
-      #print(readbuf)
-      if readbuf is not None:
-        for i in range(len(readbuf)):
-          buf[index] = readbuf[i]
-          index = index + 1
-    return index
-
-  # --- data validation   ------------------------------------------------------
+      n = self._uart.readinto(self._rx_buf)
+      if not n:
+        break
+      self._parser.feed(self._rx_buf, n)
+
+  # --- data validation. Checksum is the low 8 bits of the sum of all bytes -----
   def checksum(self, data, length):
     val = 0
     for i in range(length):
-      val = (val + data[i]) % 255
+      val = (val + data[i]) & 0xff
     return val
 
   # --- takes bytearray and appends checksum byte ------------------------------
-  def appendChecksum(self, data, length):
-      return data + bytes([self.checksum(data, length)])
-
   def appendChecksum(self, data):
       return data + bytes([self.checksum(data, len(data))])
 
   def validateCrc(self, data, length):
-    return self.checksum(data[0:length-1], length-1) == data[length-1]
+    return self.checksum(data, length-1) == data[length-1]
+
+  # --- frame encoder. Writes a 3 byte command header, its arguments and the checksum
+  # into the player's preallocated frame buffer and returns a preallocated memoryview
+  # of the encoded frame, so sending a parameterised command allocates nothing
+  def _encode1(self, cmd, arg):
+    frame    = self._frame
+    frame[0] = cmd[0]
+    frame[1] = cmd[1]
+    frame[2] = cmd[2]
+    frame[3] = arg
+    frame[4] = (cmd[0] + cmd[1] + cmd[2] + arg) & 0xff
+    return self._frame_views[5]
+
+  def _encode2(self, cmd, arg):
+    hi       = (arg >> 8) & 0xff
+    lo       = arg & 0xff
+    frame    = self._frame
+    frame[0] = cmd[0]
+    frame[1] = cmd[1]
+    frame[2] = cmd[2]
+    frame[3] = hi
+    frame[4] = lo
+    frame[5] = (cmd[0] + cmd[1] + cmd[2] + hi + lo) & 0xff
+    return self._frame_views[6]
 
   # --- send/read commands -----------------------------------------------------
-  def sendCommand(self, cmd):
-    if isinstance(cmd, bytearray):
-        self._write_data(cmd)
+  # cmd may be any complete frame: a pre-checksummed constant or an encoder view.
+  # Sent right away if the transmit window is open, otherwise queued for poll().
+  # Never blocks
+  def sendCommand(self, cmd, query=None):
+    now = ticks_ms()
+    if self._tx_count == 0 and self._window_open(now) and not self._cue_reserved(now):
+      self._transmit(cmd, query, now)
     else:
-        self._write_data(bytearray(cmd))
-
-  # --- TBD path commands not yet functional
-  def sendPathCommand(self, cmd, path):
-    device = 1
+      self._enqueue(cmd, query)
+
+  # True if a frame sent now can't land inside the module's latency window.
+  # A negative diff means _last_tx is days old and has wrapped
+  def _window_open(self, now):
+    since = ticks_diff(now, self._last_tx)
+    return since > self._latency_ms or since < 0
+
+  def _transmit(self, frame, query, now):
+    self._write_data(frame)
+    if tracer.enabled:
+      tracer.stamp(STAGE_UART_WRITE)
+    self._last_tx = now
+    op = frame[1]
+    if op in DYPlayer._TRANSPORT_OPS:
+      if op in DYPlayer._PLAY_OPS:
+        self.plays_sent   = self.plays_sent + 1
+        self.last_play_tx = now
+      if self._cue_selected:                  # The module no longer has the cued track selected
+        self._cue_selected = False
+        self._cue_prearm   = self._cue_song >= 0
+    if query is not None:
+      query.sent_time = now
+      self._pending.append(query)
+
+  # --- add a frame to the transmit queue, coalescing it with queued frames -----
+  def _enqueue(self, cmd, query):
+    op = cmd[1]
+    if query is None:
+      if op in DYPlayer._SETTING_OPS:         # Overwrite a queued value for the same setting
+        i = self._tx_count - 1
+        while i >= 0 and self._tx_op[i] != op:
+          i = i - 1
+        if i >= 0:
+          # Only if no transport command is queued after it, which would then run
+          # with the new value instead of the one set before it
+          j = i + 1
+          while j < self._tx_count and self._tx_op[j] not in DYPlayer._TRANSPORT_OPS:
+            j = j + 1
+          if j == self._tx_count:
+            self._store(i, cmd, None)
+            return
+      if op in DYPlayer._ABSOLUTE_OPS:        # e.g. stop then play collapses to just play
+        i = 0
+        while i < self._tx_count:
+          qop = self._tx_op[i]
+          if qop in DYPlayer._TRANSPORT_OPS or (qop == 0x1f and op != 0x04 and op != 0x10):
+            self._remove_queued(i)
+          else:
+            i = i + 1
+    if self._tx_count == DYPlayer.TX_QUEUE_LEN:
+      self._remove_queued(0)
+      self.tx_dropped = self.tx_dropped + 1
+    self._store(self._tx_count, cmd, query)
+    self._tx_count = self._tx_count + 1
+
+  def _store(self, i, cmd, query):
+    if isinstance(cmd, bytes):
+      self._tx_frame[i] = cmd
+    else:
+      slot = self._tx_slot[i]
+      buf  = self._tx_slots[slot]
+      n    = len(cmd)
+      for j in range(n):
+        buf[j] = cmd[j]
+      self._tx_frame[i] = self._tx_views[slot][n]
+    self._tx_op[i]    = cmd[1]
+    self._tx_query[i] = query
+
+  # --- remove queue entry i, expiring its query if it has one ------------------
+  def _remove_queued(self, i):
+    query = self._tx_query[i]
+    slot  = self._tx_slot[i]
+    last  = self._tx_count - 1
+    for j in range(i, last):
+      self._tx_slot[j]  = self._tx_slot[j + 1]
+      self._tx_frame[j] = self._tx_frame[j + 1]
+      self._tx_op[j]    = self._tx_op[j + 1]
+      self._tx_query[j] = self._tx_query[j + 1]
+    self._tx_slot[last]  = slot
+    self._tx_frame[last] = None
+    self._tx_query[last] = None
+    self._tx_count = last
+    if query is not None:
+      query.expire()
+
+  # --- send the cued switch when due, else the oldest queued frame, if the
+  # transmit window is open
+  def _flush(self, now):
+    if not self._window_open(now):
+      return
+    if self._cue_song >= 0:
+      until = ticks_diff(self._cue_at, now)
+      if until <= 0:
+        self._send_cue(now)
+        return
+      if until <= self._latency_ms:           # Window kept free for the cue
+        return
+      if self._cue_prearm and not self._transport_queued():
+        # Select ahead of queued settings, but after any queued play or stop,
+        # which would undo the selection
+        self._cue_prearm   = False
+        self._cue_selected = True
+        self._transmit(self._encode2(DYPlayer.CMD_SELECT_SONG, self._cue_song), None, now)
+        return
+    if self._tx_count:
+      frame = self._tx_frame[0]
+      query = self._tx_query[0]
+      self._tx_query[0] = None
+      self._remove_queued(0)
+      self._transmit(frame, query, now)
+
+  def _transport_queued(self):
+    for i in range(self._tx_count):
+      if self._tx_op[i] in DYPlayer._TRANSPORT_OPS:
+        return True
+    return False
+
+  # --- cued track switches ------------------------------------------------------
+  # cueByNumber() has poll() play track num at tick at, e.g. when the previous
+  # track of a sequence ends. No other frame goes out in the latency window before
+  # at, so the switch is never held back by the transmit pacing as long as it is
+  # cued more than latency seconds ahead. With prearm the track is first selected
+  # (as soon as a window is free), so the module has it open and a plain play
+  # starts it at the switch. Only use prearm with a module that keeps playing when
+  # a track is selected. Any play or stop command sent meanwhile cancels the cue
+  def cueByNumber(self, num, at, prearm=False):
+    self._cue_song     = num
+    self._cue_at       = at
+    self._cue_prearm   = prearm
+    self._cue_selected = False
+
+  def isCued(self):
+    return self._cue_song >= 0
+
+  def cancelCue(self):
+    self._cue_song   = -1
+    self._cue_prearm = False
+
+  # True while the transmit window must stay free for the cued switch
+  def _cue_reserved(self, now):
+    return self._cue_song >= 0 and ticks_diff(self._cue_at, now) <= self._latency_ms
+
+  def _send_cue(self, now):
+    song = self._cue_song
+    if self._cue_selected:
+      frame = DYPlayer.CMD_PLAY
+    else:
+      frame = self._encode2(DYPlayer.CMD_PLAY_BY_NUMBER, song)
+    self.cancelCue()
+    self._transmit(frame, None, now)
+    self._set_state(PlayState.PLAYING, song)
+
+  # --- encode a path command frame ------------------------------------------
+  # The module expects the path in upper case with the extension dot replaced by
+  # '*' and a '*' before every '/' after the root one, e.g. "/sounds/00001.mp3"
+  # becomes "/SOUNDS*/00001*MP3". Returns the complete checksummed frame
+  def encodePathCommand(self, cmd, path, drive=Drive.SD):
     path = path.upper()
-    print(path)
-    bytepath = str.encode(path)
-    print(bytepath)
     pathlen = len(path)
-    if pathlen < 1:
-        return
+    if pathlen < 1 or path[0] != '/':
+      raise ValueError("path must start with '/'")
     # Count "/" in path, except root slash and determine new length
     num_slash = path[1:].count('/')
-    print(num_slash, " slashes")
-    bytecmd = bytearray(len(cmd) + pathlen + num_slash + 2)
-    cmdlen = len(cmd)
-    for i in range(cmdlen):
-        bytecmd[i] = cmd[i]
-
-    print(bytecmd)
-    print(pathlen + num_slash)
-    bytecmd[cmdlen]        = pathlen + num_slash
-    print(bytecmd)
-    bytecmd[cmdlen + 1]    = device
-    bytecmd[cmdlen + 2]    = ord(path[0])
-    idx = 3
+    datalen   = pathlen + num_slash + 1           # Encoded path plus the drive byte
+    if datalen > 0xff:
+      raise ValueError("path is too long")
+    bytepath  = path.encode()
+    frame     = bytearray(len(cmd) + datalen + 2)
+    frame[0]  = cmd[0]
+    frame[1]  = cmd[1]
+    frame[2]  = datalen
+    frame[3]  = drive
+    frame[4]  = bytepath[0]
+    idx = 5
     for i in range(1, pathlen):
-      ch = path[i]
-      bytech = bytepath[i]
-      #print(ch, bytech)
-      if ch == '.':
-        #print("here")
-        bytecmd[cmdlen + idx] = ord('*')
-        idx = idx + 1
+      ch = bytepath[i]
+      if ch == 0x2e:                              # '.'
+        frame[idx] = 0x2a                         # '*'
       else:
-        if ch == '/':
-          bytecmd[cmdlen + idx] = ord('*')
+        if ch == 0x2f:                            # '/'
+          frame[idx] = 0x2a
           idx = idx + 1
-        bytecmd[cmdlen + idx] = bytech
-        idx = idx + 1
-    print("cmd = ", bytecmd)
-    self._write_data(bytecmd,)
-    self._write_data(bytes([self.checksum(bytecmd, len(bytecmd))]))
-
-    #fullcmd = self.appendChecksum(bytecmd)
-    #print("path command = ", fullcmd)
-    #self.sendCommand(fullcmd)
-
-
-  # Timeout determines how long to wait for response
-  def getResponse(self, buffer, timeout = 1):
-    nbytes = 0
-    start = time.monotonic()
-    while (nbytes == 0 and time.monotonic() - start < timeout):
-        nbytes = self._read_data(buffer)
-    if nbytes == 0:
-      print("no data received")
-      return 0
-    if self.validateCrc(buffer, nbytes):
-      return nbytes
-    else:
-      print("data not validated ", buffer)
-      return 0
-
+        frame[idx] = ch
+      idx = idx + 1
+    frame[idx] = self.checksum(frame, idx)
+    return bytes(frame)
+
+  # --- encoded frame for a path, from the bounded path cache ------------------
+  def _path_frame(self, cmd, path, drive):
+    frame = self._path_cache.get(path)
+    if frame is None or frame[1] != cmd[1] or frame[3] != drive:
+      frame = self.encodePathCommand(cmd, path, drive)
+      if path not in self._path_cache:
+        if len(self._path_order) >= self.path_cache_size:
+          del self._path_cache[self._path_order.pop(0)]
+        self._path_order.append(path)
+      self._path_cache[path] = frame
+    return frame
+
+  def sendPathCommand(self, cmd, path, drive=Drive.SD):
+    self.sendCommand(self._path_frame(cmd, path, drive))
+
+  # --- encode the paths a show uses ahead of time so playing them costs no more
+  # than playByNumber. Only the last path_cache_size paths are kept
+  def preparePaths(self, paths, drive=Drive.SD):
+    for path in paths:
+      self._path_frame(DYPlayer.CMD_PLAY_BY_PATH, path, drive)
+
+  # --- note a command that changes what is playing, so any status query already
+  # sent cannot overwrite the new state with an older answer
+  def _set_state(self, play_state, song):
+    if self._fading and self._fade_then != DYPlayer._FADE_THEN_NONE:
+      self._cancel_fade_out()       # A new command overrides a fade out in progress
+    self._cue_song    = -1          # A new command overrides a cued switch too
+    self.play_state   = play_state
+    self.current_song = song
+    self._state_gen   = self._state_gen + 1
+    self._last_transport = ticks_ms()
 
   # --- play current file ---------------------------------------------------------
   def play(self):
     self.sendCommand(DYPlayer.CMD_PLAY)
+    self._set_state(PlayState.PLAYING, self.current_song)
 
   # --- play the next file --------------------------------------------------------
   def next(self):
     self.sendCommand(DYPlayer.CMD_NEXT)
+    self._set_state(PlayState.PLAYING, self._step_song(1))
 
   # --- play the previous file -----------------------------------------------------
   def prev(self):
       self.sendCommand(DYPlayer.CMD_PREV)
+      self._set_state(PlayState.PLAYING, self._step_song(-1))
 
   # --- stop ----------------
   def stop(self):
       self.sendCommand(DYPlayer.CMD_STOP)
+      self._set_state(PlayState.STOPPED, self.current_song)
 
   # --- stop playing --------------------------------------------------------------
   def stopPlaying(self):
       self.sendCommand(DYPlayer.CMD_STOP_PLAYING)
+      self._set_state(PlayState.STOPPED, self.current_song)
 
   # --- pause ----------------------------------------------------------------------
   def pause(self):
       self.sendCommand(DYPlayer.CMD_PAUSE)
+      self._set_state(PlayState.PAUSED, self.current_song)
+
+  # --- song number after moving step songs, wrapping if the song count is known --
+  def _step_song(self, step):
+    if self.current_song is None:
+      return None
+    song = self.current_song + step
+    if self._num_songs:
+      song = (song - 1) % self._num_songs + 1
+    return song
+
+  # --- non-blocking queries ---------------------------------------------------
+  # Each of these sends the query and returns a PendingQuery immediately. Call
+  # poll() on every main loop tick to complete it.
+  def sendQuery(self, cmd, callback=None, timeout=1.0):
+    query = PendingQuery(cmd[1], callback, timeout)
+    query.generation = self._state_gen
+    self.sendCommand(cmd, query)
+    return query
+
+  # --- send a query again using an existing PendingQuery object
+  def _resend(self, cmd, query):
+    query.reset(self._state_gen)
+    self.sendCommand(cmd, query)
+    return query
+
+  def queryPlayStateAsync(self, callback=None, timeout=1.0):
+    return self.sendQuery(DYPlayer.QUERY_PLAY_STATUS, callback, timeout)
+
+  def queryCurrentSongAsync(self, callback=None, timeout=1.0):
+    return self.sendQuery(DYPlayer.QUERY_CURRENT_SONG, callback, timeout)
+
+  def queryNumSongsAsync(self, callback=None, timeout=1.0):
+    return self.sendQuery(DYPlayer.QUERY_NUM_SONGS, callback, timeout)
+
+  def queryDeviceAsync(self, callback=None, timeout=3.0):
+    return self.sendQuery(DYPlayer.QUERY_PLAY_DRIVE, callback, timeout)
+
+  def queryOnlineDriveAsync(self, callback=None, timeout=1.0):
+    return self.sendQuery(DYPlayer.QUERY_ONLINE_DRIVE, callback, timeout)
+
+  # --- call repeatedly in the main loop to send queued commands and complete
+  # pending queries. Never blocks. Returns the number of queries still waiting
+  # for a response
+  def poll(self):
+    now = ticks_ms()
+    self._age_timestamps(now)
+    if self._fading:
+      self._update_fade(now)
+    self._flush(now)
+    if self._uart.in_waiting:
+      self._read_data()
+    parser = self._parser
+    while parser.next_frame():
+      self._dispatch(parser.kind, parser.value, now)
+    interval = self._status_interval_ms()
+    if (interval is not None and self._status_query is None
+        and (self._last_status < 0 or ticks_diff(now, self._last_status) >= interval)):
+      self._request_status()
+    if not self._pending:
+      return 0
+    # Each query has its own timeout, so a short one can expire before an older long one
+    pending = self._pending
+    i = 0
+    while i < len(pending):
+      if ticks_diff(now, pending[i].sent_time) > pending[i].timeout_ms:
+        pending.pop(i).expire()
+      else:
+        i = i + 1
+    return len(pending)
+
+  # --- keep the timestamps that are only set on activity young enough for
+  # ticks_diff(), so the player still works after days without a command
+  def _age_timestamps(self, now):
+    self._last_tx = ticks_age_limit(self._last_tx, now)
+    if self._last_status >= 0:
+      self._last_status = ticks_age_limit(self._last_status, now)
+    if self._last_transport >= 0:
+      self._last_transport = ticks_age_limit(self._last_transport, now)
+    if self._num_songs_time >= 0:
+      self._num_songs_time = ticks_age_limit(self._num_songs_time, now)
+    if self._drive_time >= 0:
+      self._drive_time = ticks_age_limit(self._drive_time, now)
+
+  # --- milliseconds between background status polls right now, or None for none
+  def _status_interval_ms(self):
+    interval = self.status_interval_ms
+    if self._watchers and self._busy is None:
+      if interval is None or self.watch_interval_ms < interval:
+        interval = self.watch_interval_ms
+    return interval
+
+  # --- milliseconds until poll() next has work to do, or None if the player is
+  # idle. Lets a main loop sleep between passes without delaying queued commands
+  def nextPollMs(self):
+    now    = ticks_ms()
+    delay  = None
+    window = max(self._latency_ms + 1 - ticks_diff(now, self._last_tx), 0)  # Until a frame may go out
+    if self._cue_song >= 0:
+      until = max(ticks_diff(self._cue_at, now), 0)
+      if until - window <= self._latency_ms:
+        window = until                # Nothing else goes out before the cue
+      delay = window if self._cue_prearm else until
+    if self._tx_count or self._fading:
+      delay = window if delay is None else min(delay, window)
+    if self._pending or self._uart.in_waiting:
+      delay = 10 if delay is None else min(delay, 10)   # Collect responses promptly
+    interval = self._status_interval_ms()
+    if interval is not None and self._status_query is None:
+      wait = 0 if self._last_status < 0 else max(interval - ticks_diff(now, self._last_status), 0)
+      delay = wait if delay is None else min(delay, wait)
+    return delay
+
+  # --- seconds until poll() next has work to do, or None if the player is idle
+  def nextPollDelay(self):
+    delay = self.nextPollMs()
+    return None if delay is None else delay / 1000
+
+  # --- hand a parsed response to the oldest query waiting for it --------------
+  # Responses that no query is waiting for (e.g. after a timeout) are ignored
+  def _dispatch(self, kind, value, now):
+    for i in range(len(self._pending)):
+      if self._pending[i].opcode == kind:
+        query = self._pending.pop(i)
+        self._update_mirror(query, kind, value, now)
+        query.complete(value)
+        return
+
+  # --- correct the state mirror and caches from a query response --------------
+  def _update_mirror(self, query, kind, value, now):
+    if kind == Response.PLAY_STATE or kind == Response.CURRENT_SONG:
+      if query.generation != self._state_gen:   # We changed the state after asking
+        return
+      if kind == Response.PLAY_STATE:
+        self.play_state = value
+      else:
+        self.current_song = value
+    elif kind == Response.NUM_SONGS:
+      self._num_songs       = value
+      self._num_songs_time  = now
+    elif kind == Response.ONLINE_DRIVE:
+      self._drive           = value
+      self._drive_time      = now
+
+  # --- background status poll, alternating play state and current song --------
+  # While watching for the end of a track only the play state is polled
+  def _request_status(self):
+    self._status_toggle = not self._status_toggle
+    if self._status_toggle or self._watchers:
+      self._status_query = self._resend(DYPlayer.QUERY_PLAY_STATUS, self._status_play)
+    else:
+      self._status_query = self._resend(DYPlayer.QUERY_CURRENT_SONG, self._status_song)
+
+  def _status_done(self, query):
+    self._status_query  = None
+    self._last_status   = ticks_ms()
+
+  # --- end of track detection -------------------------------------------------
+  # Call watch() while something needs isPlaying() to notice the end of a track,
+  # and unwatch() when done. Without a BUSY pin, watching makes poll() query the
+  # play state every watch_interval seconds, so the end of a track is seen within
+  # about watch_interval + latency seconds
+  def watch(self):
+    self._watchers = self._watchers + 1
+
+  def unwatch(self):
+    if self._watchers > 0:
+      self._watchers = self._watchers - 1
+
+  # Returns False once the player has stopped (or paused). Never blocks
+  def isPlaying(self):
+    if self._busy is not None and (self._last_transport < 0
+        or ticks_diff(ticks_ms(), self._last_transport) > self.busy_grace_ms):
+      return not self._busy.value
+    return self.play_state != PlayState.STOPPED and self.play_state != PlayState.PAUSED
+
+  # --- cached reads. Return the cached value (None if never read) and start a
+  # background refresh when it is older than its TTL. Never block
+  def getNumSongs(self):
+    if (self._num_songs_query is None and (self._num_songs is None or
+        ticks_diff(ticks_ms(), self._num_songs_time) > self.num_songs_ttl_ms)):
+      self._num_songs_query = self.queryNumSongsAsync(self._clear_num_songs_query)
+    return self._num_songs
+
+  def getOnlineDrive(self):
+    if (self._drive_query is None and (self._drive is None or
+        ticks_diff(ticks_ms(), self._drive_time) > self.drive_ttl_ms)):
+      self._drive_query = self.queryOnlineDriveAsync(self._clear_drive_query)
+    return self._drive
+
+  def _clear_num_songs_query(self, query):
+    self._num_songs_query = None
+
+  def _clear_drive_query(self, query):
+    self._drive_query = None
+
+  # --- wait for a query to complete. Blocks, so avoid in the main loop --------
+  def _wait(self, query):
+    while not query.done:
+      self.poll()
+    return query.result
 
   # --- find the current device ----------------------------------------------------
   def queryDevice(self):
-      self.sendCommand(DYPlayer.QUERY_PLAY_DRIVE)
-      resp = bytearray(10)
-      print("waiting...")  # Need to give MP3 player time to respond
-      time.sleep(2)
-      val = self.getResponse(resp)
-      if (val):
-          #print("response was: ", resp)
-          return resp[3]
-      else:
-          print("query failed to get response")
-          return None
+      val = self._wait(self.queryDeviceAsync())
+      if val is None:
+          log.warning("query failed to get response")
+      return val
 
   # --- get the current play state, can be called any time. Returns value from PlayState class -----
   def queryPlayState(self):
-      self.sendCommand(DYPlayer.QUERY_PLAY_STATUS)
-      resp = bytearray(16)
-      time.sleep(0.1)  #Don't know if this is necessary
-      val = self.getResponse(resp)
-      if val:
-          #print("val = ", val, " response = ", resp[0:val])
-          #print("response was:", resp[0:val])
-          return resp[3]  # Play state is 4th byte of response
-      else:
-          #print("failed to get response")
-          return None
+      return self._wait(self.queryPlayStateAsync())
 
   # --- get the number of the current song ------------------
   def queryCurrentSong(self):
-      self.sendCommand(DYPlayer.QUERY_CURRENT_SONG)
-      resp = bytearray(16)
-      time.sleep(0.5)
-      val = self.getResponse(resp)
-      if val:
-        #print("val = ", val, " response = ", resp)
-        return (resp[3] << 8) | resp[4]
-      else:
-        print("failed to get response")
-        return None
+      val = self._wait(self.queryCurrentSongAsync())
+      if val is None:
+        log.warning("failed to get response")
+      return val
 
-  # --- get the number of songs available --------------------
+  # --- get the number of songs available. Answered from the cache while it is fresh
   def queryNumSongs(self):
-      self.sendCommand(DYPlayer.QUERY_NUM_SONGS)
-      resp = bytearray(16)
-      time.sleep(0.5)
-      val = self.getResponse(resp)
-      if val:
-        #print("Query num songs val = ", val, " response = ", resp[0:val])
-        return (resp[3] << 8) | resp[4]
-      else:
-        #print("failed to get response")
-        return None
+      if self._num_songs is not None and ticks_diff(ticks_ms(), self._num_songs_time) <= self.num_songs_ttl_ms:
+          return self._num_songs
+      return self._wait(self.queryNumSongsAsync())
 
   # --- set the volume to a value between 0 and 30
   def setVolume(self, vol):
     vol = clamp(vol, 0, 30)
-    cmd = self.appendChecksum( DYPlayer.SET_VOLUME + bytes([vol]) )
-    self.sendCommand(cmd)
+    self.sendCommand(self._encode1(DYPlayer.SET_VOLUME, vol))
+    self.volume = vol
 
-  def increaseVolume(self, vol):
+  def increaseVolume(self):
     self.sendCommand(DYPlayer.CMD_VOL_UP)
+    if self.volume is not None:
+      self.volume = min(self.volume + 1, 30)
 
-  def decreaseVolume(self, vol):
+  def decreaseVolume(self):
     self.sendCommand(DYPlayer.CMD_VOL_DOWN)
-
-  # --- Set the loop mode ---
+    if self.volume is not None:
+      self.volume = max(self.volume - 1, 0)
+
+  # --- volume fades --------------------------------------------------------------
+  # Fades run in the background: poll() sends one SET_VOLUME step per transmit
+  # window until the target is reached, so they never block and never send more
+  # frames than the module accepts. A new fade replaces the one in progress. If no
+  # volume was ever set, the module's power up volume (DEFAULT_VOLUME) is assumed
+
+  # Ramp from the current volume to vol over duration seconds
+  def fadeTo(self, vol, duration):
+    self._start_fade(self._known_volume(), clamp(vol, 0, 30), ms(duration),
+                     DYPlayer._FADE_THEN_NONE)
+
+  # Ramp up from silence. Call before starting the track, so the volume is already
+  # 0 when it starts. Fades to vol, or to the current volume if vol is not given
+  def fadeIn(self, duration, vol=None):
+    if vol is None:
+      vol = self._known_volume()
+    self.setVolume(0)
+    self._start_fade(0, clamp(vol, 0, 30), ms(duration), DYPlayer._FADE_THEN_NONE)
+
+  # Ramp down to silence, then stop the player and restore the volume so the next
+  # track is audible. Any play or stop command sent meanwhile cancels the fade
+  def fadeOut(self, duration):
+    self._fade_restore = self._known_volume()
+    self._start_fade(self._fade_restore, 0, ms(duration), DYPlayer._FADE_THEN_STOP)
+
+  # The module plays one track at a time, so a crossfade fades the current track
+  # out over the first half of duration, switches to track, and fades it back in
+  # to the current volume over the second half
+  def crossfade(self, track, duration):
+    self._fade_restore = self._known_volume()
+    self._fade_track   = track
+    self._start_fade(self._fade_restore, 0, ms(duration) // 2, DYPlayer._FADE_THEN_PLAY)
+
+  def _known_volume(self):
+    return self.volume if self.volume is not None else DYPlayer.DEFAULT_VOLUME
+
+  def isFading(self):
+    return self._fading
+
+  def cancelFade(self):
+    if self._fading and self._fade_then != DYPlayer._FADE_THEN_NONE:
+      self._cancel_fade_out()
+    self._fading = False
+
+  # duration_ms is in milliseconds
+  def _start_fade(self, start_vol, end_vol, duration_ms, then):
+    now = ticks_ms()
+    self._fading          = True
+    self._fade_from       = start_vol
+    self._fade_to         = end_vol
+    self._fade_start      = now
+    self._fade_duration   = duration_ms
+    self._fade_step_time  = ticks_add(now, -self._latency_ms)  # First step goes out on the next poll
+    self._fade_then       = then
+
+  def _cancel_fade_out(self):
+    self._fading    = False
+    self._fade_then = DYPlayer._FADE_THEN_NONE
+    self.setVolume(self._fade_restore)
+
+  def _update_fade(self, now):
+    if ticks_diff(now, self._fade_step_time) <= self._latency_ms:
+      return
+    self._fade_step_time = now
+    elapsed = ticks_diff(now, self._fade_start)
+    if elapsed < self._fade_duration:
+      vol = self._fade_from + (self._fade_to - self._fade_from) * elapsed // self._fade_duration
+      if vol != self.volume:
+        self.setVolume(vol)
+      return
+    # Fade complete
+    self.setVolume(self._fade_to)
+    self._fading = False
+    then = self._fade_then
+    self._fade_then = DYPlayer._FADE_THEN_NONE
+    if then == DYPlayer._FADE_THEN_STOP:
+      self.stop()
+      # Queued behind the stop (settings are never moved ahead of a queued
+      # transport command), so the volume only comes back once playing has stopped
+      self.setVolume(self._fade_restore)
+    elif then == DYPlayer._FADE_THEN_PLAY:
+      self.playByNumber(self._fade_track)
+      self._start_fade(0, self._fade_restore, self._fade_duration, DYPlayer._FADE_THEN_NONE)
+
+  # --- Set the loop mode (one of the PlayMode values) ---
   def setCycleMode(self, mode):
-    cmd = self.appendChecksum( DYPlayer.SET_CYCLE_MODE + mode )
-    self.sendCommand(cmd)
+    self.sendCommand(self._encode1(DYPlayer.SET_CYCLE_MODE, mode[0]))
+    self.cycle_mode = mode
 
   # Set the number of times to loop
   def setCycleTimes(self, num):
-    cmd = self.appendChecksum(DYPlayer.SET_CYCLE_TIMES + bytes([num >> 8]) + bytes([num & 0xff]) )
-    self.sendCommand(cmd)
+    self.sendCommand(self._encode2(DYPlayer.SET_CYCLE_TIMES, num))
 
   # --- play a song by number order ------
   def playByNumber(self, num):
-    cmd = self.appendChecksum( DYPlayer.CMD_PLAY_BY_NUMBER + bytes([num >> 8]) + bytes([num & 0xff]) )
-    self.sendCommand(cmd)
+    self.sendCommand(self._encode2(DYPlayer.CMD_PLAY_BY_NUMBER, num))
+    self._set_state(PlayState.PLAYING, num)
 
   # --- select a song to be the "current" sound, but don't play it ---
   def selectByNumber(self, num):
-    cmd = self.appendChecksum( DYPlayer.CMD_SELECT_SONG + bytes([num >> 8]) + bytes([num & 0xff]) )
-    self.sendCommand(cmd)
+    self.sendCommand(self._encode2(DYPlayer.CMD_SELECT_SONG, num))
+    self._set_state(self.play_state, num)
 
-  # --- play a song specified by its path (assume device=1 is SD card) -----
-  # NOT YET WORKING
-  def playByPath(self, path):
-    self.sendPathCommand(DYPlayer.CMD_PLAY_BY_PATH, path)
+  # --- play a song specified by its path on the given drive (default SD card) -----
+  def playByPath(self, path, drive=Drive.SD):
+    self.sendPathCommand(DYPlayer.CMD_PLAY_BY_PATH, path, drive)
+    self._set_state(PlayState.PLAYING, None)
 
 
 
@@ -0,0 +1,305 @@
+# ----------------------------------------------------------------------------
+# Software stand-in for a DY-SV5W Playback Module.
+#
+# Pass an instance as the uart argument of DYPlayer to run the driver without
+# hardware, e.g. on a Linux box:
+#
+#   sim    = DYPlayerEmulator(num_songs=20, durations={3: 4.5})
+#   player = DYPlayer(uart=sim)
+#
+# The emulator decodes the command frames listed in DYPlayer, keeps track of the
+# current song and play state (including tracks ending and the cycle modes), and
+# answers queries with checksummed response frames. Responses only become
+# readable after response_latency seconds, and commands that arrive less than
+# min_command_interval seconds after the previous accepted command are dropped,
+# as the real module does. drop_rate adds random drops to model line noise.
+#
+# A track is audible start_delay seconds after the command that opens it (play
+# by number or path, next, previous or select); the track it replaces stops at
+# once, so a plain switch leaves a gap of start_delay. Playing the selected track
+# needs no further delay. select_stops chooses whether selecting a track stops the
+# one playing (the datasheet only says the selected track is not played).
+#
+# The clock argument lets a test drive time by hand instead of time.monotonic.
+#
+# License: MIT
+# ----------------------------------------------------------------------------
+
+import random
+import time
+
+from dyplayer import DYPlayer, PlayState, PlayMode, Drive
+
+
+class DYPlayerEmulator():
+
+    def __init__(self, num_songs=10, durations=None, default_duration=3.0, folders=None,
+                 paths=None, response_latency=0.020, min_command_interval=0.100,
+                 drop_rate=0.0, seed=None, clock=None, start_delay=0.0, select_stops=False):
+        self.num_songs              = num_songs
+        self.durations              = durations if durations is not None else {}  # Seconds by song number
+        self.default_duration       = default_duration
+        self.folders                = folders if folders is not None else [num_songs]  # Songs per folder, in order
+        self.paths                  = paths if paths is not None else {}          # Song number by upper case path
+        self.response_latency       = response_latency
+        self.min_command_interval   = min_command_interval
+        self.drop_rate              = drop_rate
+        self.start_delay            = start_delay
+        self.select_stops           = select_stops
+        self.clock                  = clock if clock is not None else time.monotonic
+        self._random                = random.Random(seed)
+
+        # Player state
+        self.play_state             = PlayState.STOPPED
+        self.current_song           = 1
+        self.volume                 = 20
+        self.cycle_mode             = PlayMode.ONE_OFF[0]
+        self.cycle_times            = 0
+        self.song_start             = -1        # Time the current song started playing
+        self.song_offset            = 0         # Seconds already played before a pause
+        self.selected               = None      # Song opened by select, not yet played
+        self.selected_ready         = 0         # Time the selected song is open
+
+        # Serial link
+        self._rx                    = bytearray()   # Bytes written by the driver, not yet decoded
+        self._tx                    = []            # [ready_time, bytes] responses on their way back
+        self._last_accepted         = None
+
+        # Statistics
+        self.commands               = []        # (time, opcode) of every accepted command
+        self.events                 = []        # (time, "start"/"stop", song) playback history
+        self.dropped                = 0         # Commands dropped for arriving too fast or noise
+        self.bad_frames             = 0         # Frames ignored because of a bad checksum
+
+    # --- UART interface used by DYPlayer -------------------------------------------
+    def write(self, buf):
+        self._rx.extend(buf)
+        self._decode()
+        return len(buf)
+
+    @property
+    def in_waiting(self):
+        now = self.clock()
+        self._advance(now)
+        count = 0
+        for ready, data in self._tx:
+            if ready > now:
+                break
+            count = count + len(data)
+        return count
+
+    def readinto(self, buf):
+        now   = self.clock()
+        count = 0
+        while self._tx and self._tx[0][0] <= now and count < len(buf):
+            data = self._tx[0][1]
+            n = min(len(data), len(buf) - count)
+            buf[count:count + n] = data[0:n]
+            count = count + n
+            if n == len(data):
+                self._tx.pop(0)
+            else:
+                self._tx[0][1] = data[n:]
+        return count if count else None
+
+    def read(self, nbytes=None):
+        buf = bytearray(nbytes if nbytes is not None else self.in_waiting)
+        n = self.readinto(buf)
+        return bytes(buf[0:n]) if n else None
+
+    # --- frame decoding ---------------------------------------------------------------
+    def _decode(self):
+        rx = self._rx
+        while rx:
+            if rx[0] != 0xaa:
+                del rx[0]
+                continue
+            if len(rx) < 3:
+                return
+            total = rx[2] + 4
+            if len(rx) < total:
+                return
+            frame = bytes(rx[0:total])
+            del rx[0:total]
+            if sum(frame[0:-1]) & 0xff != frame[-1]:
+                self.bad_frames = self.bad_frames + 1
+                continue
+            self._receive(frame)
+
+    def _receive(self, frame):
+        now = self.clock()
+        self._advance(now)
+        if ((self._last_accepted is not None and now - self._last_accepted < self.min_command_interval)
+                or (self.drop_rate and self._random.random() < self.drop_rate)):
+            self.dropped = self.dropped + 1
+            return
+        self._last_accepted = now
+        opcode = frame[1]
+        self.commands.append((now, opcode))
+        self._execute(opcode, frame[3:-1], now)
+
+    # --- command set ------------------------------------------------------------------
+    def _execute(self, op, data, now):
+        if op == DYPlayer.CMD_PLAY[1]:
+            if self.selected is not None and (self.play_state != PlayState.PLAYING
+                                              or self.selected != self.current_song):
+                self._start(self.selected, now, ready=max(now, self.selected_ready))
+            elif self.play_state != PlayState.PLAYING:
+                self._start(self.current_song, now, resume=self.play_state == PlayState.PAUSED)
+        elif op == DYPlayer.CMD_PAUSE[1]:
+            if self.play_state == PlayState.PLAYING:
+                self.song_offset = self.song_offset + now - self.song_start
+                self._set_stopped(PlayState.PAUSED, now)
+        elif op == DYPlayer.CMD_STOP[1] or op == DYPlayer.CMD_STOP_PLAYING[1]:
+            self._set_stopped(PlayState.STOPPED, now)
+        elif op == DYPlayer.CMD_NEXT[1]:
+            self._start(self._wrap(self.current_song + 1), now)
+        elif op == DYPlayer.CMD_PREV[1]:
+            self._start(self._wrap(self.current_song - 1), now)
+        elif op == DYPlayer.CMD_PLAY_BY_NUMBER[1]:
+            self._start(self._song(data), now)
+        elif op == DYPlayer.CMD_SELECT_SONG[1]:
+            self.selected       = self._song(data)
+            self.selected_ready = now + self.start_delay
+            if self.select_stops or self.play_state != PlayState.PLAYING:
+                self._set_stopped(PlayState.STOPPED, now)
+                self.current_song = self.selected
+        elif op == DYPlayer.CMD_PLAY_BY_PATH[1]:
+            song = self._path_song(data[1:])
+            if song is not None:
+                self._start(song, now)
+        elif op == DYPlayer.SET_VOLUME[1]:
+            self.volume = data[0]
+        elif op == DYPlayer.CMD_VOL_UP[1]:
+            self.volume = min(self.volume + 1, 30)
+        elif op == DYPlayer.CMD_VOL_DOWN[1]:
+            self.volume = max(self.volume - 1, 0)
+        elif op == DYPlayer.SET_CYCLE_MODE[1]:
+            self.cycle_mode = data[0]
+        elif op == DYPlayer.SET_CYCLE_TIMES[1]:
+            self.cycle_times = self._song(data)
+        elif op == DYPlayer.QUERY_PLAY_STATUS[1]:
+            self._respond(op, bytes([self.play_state]), now)
+        elif op == DYPlayer.QUERY_CURRENT_SONG[1]:
+            self._respond(op, self._word(self.current_song), now)
+        elif op == DYPlayer.QUERY_NUM_SONGS[1]:
+            self._respond(op, self._word(self.num_songs), now)
+        elif op == DYPlayer.QUERY_ONLINE_DRIVE[1] or op == DYPlayer.QUERY_PLAY_DRIVE[1]:
+            self._respond(op, bytes([Drive.SD]), now)
+        elif op == DYPlayer.QUERY_FOLDER_DIR_SONG[1]:
+            self._respond(op, self._word(self._folder_range(self.current_song)[0]), now)
+        elif op == DYPlayer.QUERY_FOLDER_NUM_SONG[1]:
+            first, last = self._folder_range(self.current_song)
+            self._respond(op, self._word(last - first + 1), now)
+
+    def _respond(self, op, data, now):
+        frame = bytearray([0xaa, op, len(data)]) + data
+        frame.append(sum(frame) & 0xff)
+        # Keep responses in order even if the latency is changed between them
+        ready = now + self.response_latency
+        if self._tx and self._tx[-1][0] > ready:
+            ready = self._tx[-1][0]
+        self._tx.append([ready, bytes(frame)])
+
+    @staticmethod
+    def _word(value):
+        return bytes([(value >> 8) & 0xff, value & 0xff])
+
+    @staticmethod
+    def _song(data):
+        return (data[0] << 8) | data[1]
+
+    def _wrap(self, song):
+        return (song - 1) % self.num_songs + 1
+
+    # --- decode an encoded path ("/SOUNDS*/00001*MP3") to a song number ------------
+    def _path_song(self, encoded):
+        path = encoded.decode().replace("*/", "/")
+        star = path.rfind("*")
+        if star >= 0:
+            path = path[0:star] + "." + path[star + 1:]
+        if path in self.paths:
+            return self.paths[path]
+        name = path[path.rfind("/") + 1:].split(".")[0]
+        if name.isdigit() and 1 <= int(name) <= self.num_songs:
+            return int(name)
+        return None
+
+    # --- first and last song number of the folder holding song -----------------------
+    def _folder_range(self, song):
+        first = 1
+        for count in self.folders:
+            if song < first + count:
+                return first, first + count - 1
+            first = first + count
+        return 1, self.num_songs
+
+    # --- playback -----------------------------------------------------------------------
+    def duration(self, song):
+        return self.durations.get(song, self.default_duration)
+
+    # ready is when the song becomes audible, by default start_delay after now
+    # (resuming a paused song has no delay)
+    def _start(self, song, now, resume=False, ready=None):
+        if self.play_state == PlayState.PLAYING:
+            self.events.append((now, "stop", self.current_song))
+        if not resume:
+            self.song_offset = 0
+        if ready is None:
+            ready = now if resume else now + self.start_delay
+        self.current_song   = song
+        self.play_state     = PlayState.PLAYING
+        self.song_start     = ready
+        self.selected       = None
+        self.events.append((ready, "start", song))
+
+    def _set_stopped(self, state, now):
+        if self.play_state == PlayState.PLAYING:
+            self.events.append((now, "stop", self.current_song))
+        self.play_state = state
+
+    # --- bring the playback state up to date, following the cycle mode when a
+    # song ends. Called whenever the driver talks to the emulator
+    def _advance(self, now):
+        while self.play_state == PlayState.PLAYING:
+            end = self.song_start + self.duration(self.current_song) - self.song_offset
+            if end > now:
+                return
+            self.events.append((end, "stop", self.current_song))
+            self.play_state = PlayState.STOPPED
+            nxt  = self._next_song()
+            if nxt is not None:
+                self._start(nxt, end)
+
+    def _next_song(self):
+        mode = self.cycle_mode
+        song = self.current_song
+        first, last = self._folder_range(song)
+        if mode == PlayMode.REPEAT_ONE[0]:
+            return song
+        if mode == PlayMode.REPEAT[0]:
+            return self._wrap(song + 1)
+        if mode == PlayMode.SEQUENCE[0]:
+            return song + 1 if song < self.num_songs else None
+        if mode == PlayMode.RANDOM[0]:
+            return self._random.randint(1, self.num_songs)
+        if mode == PlayMode.REPEAT_DIR[0]:
+            return song + 1 if song < last else first
+        if mode == PlayMode.SEQUENCE_DIR[0]:
+            return song + 1 if song < last else None
+        if mode == PlayMode.RANDOM_DIR[0]:
+            return self._random.randint(first, last)
+        return None     # ONE_OFF
+
+    # --- seconds between the end of one song and the start of the next, for each
+    # transition in the playback history. Used to measure track switch gaps
+    def gaps(self):
+        result = []
+        stop_time = None
+        for when, event, song in self.events:
+            if event == "stop":
+                stop_time = when
+            elif stop_time is not None:
+                result.append(when - stop_time)
+                stop_time = None
+        return result
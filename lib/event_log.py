@@ -0,0 +1,127 @@
+# ----------------------------------------------------------------------------
+# Leveled event log that keeps print() out of the time critical paths.
+#
+# A print() to the USB serial console can block for several milliseconds, which
+# delays every trigger that logs something. Instead, log calls store the level,
+# the time, a fixed message string and up to two arguments in a preallocated
+# ring buffer. Nothing is formatted until flush(), which the Scheduler calls when
+# the main loop is about to sleep. A call below the current level returns after
+# a single comparison.
+#
+#   from event_log import log, WARNING
+#   log.info("starting trigger", self.name)
+#   log.set_level(WARNING)      # only warnings and errors from now on
+#
+# Store existing objects (names, numbers) as arguments rather than building
+# strings in the call, or the allocation happens anyway. When the buffer fills
+# up before a flush, the oldest records are overwritten and counted in dropped.
+#
+# License: MIT
+# ----------------------------------------------------------------------------
+
+from tick_clock import clock
+
+DEBUG       = 10
+INFO        = 20
+WARNING     = 30
+ERROR       = 40
+OFF         = 100
+
+_LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARN", ERROR: "ERROR"}
+
+
+class EventLog:
+    def __init__(self, capacity=32, level=INFO):
+        self.capacity   = capacity
+        self.level      = level
+        self.dropped    = 0                     # Records overwritten before they were flushed
+        self._times     = [0] * capacity        # Parallel lists, one entry per record
+        self._levels    = [0] * capacity
+        self._messages  = [None] * capacity
+        self._args1     = [None] * capacity
+        self._args2     = [None] * capacity
+        self._head      = 0                     # Index of the oldest record
+        self._count     = 0
+
+    def set_level(self, level):
+        self.level = level
+
+    # True if records at level are kept
+    def enabled(self, level):
+        return level >= self.level
+
+    def debug(self, message, arg1=None, arg2=None):
+        if DEBUG >= self.level:
+            self._record(DEBUG, message, arg1, arg2)
+
+    def info(self, message, arg1=None, arg2=None):
+        if INFO >= self.level:
+            self._record(INFO, message, arg1, arg2)
+
+    def warning(self, message, arg1=None, arg2=None):
+        if WARNING >= self.level:
+            self._record(WARNING, message, arg1, arg2)
+
+    def error(self, message, arg1=None, arg2=None):
+        if ERROR >= self.level:
+            self._record(ERROR, message, arg1, arg2)
+
+    # Number of records waiting to be flushed
+    def pending(self):
+        return self._count
+
+    # True once the buffer is three quarters full, so it should be flushed even
+    # if the main loop has no time to spare
+    def needs_flush(self):
+        return self._count * 4 >= self.capacity * 3
+
+    # Print up to limit waiting records, oldest first. Returns the number printed
+    def flush(self, limit=None):
+        if self.dropped:
+            print("[log] dropped", self.dropped, "records")
+            self.dropped = 0
+        printed = 0
+        while self._count and (limit is None or printed < limit):
+            i = self._head
+            self._print(self._times[i], self._levels[i], self._messages[i], self._args1[i], self._args2[i])
+            self._messages[i] = None            # Let the arguments be collected
+            self._args1[i]    = None
+            self._args2[i]    = None
+            self._head  = (i + 1) % self.capacity
+            self._count = self._count - 1
+            printed = printed + 1
+        return printed
+
+    # Forget waiting records without printing them
+    def clear(self):
+        for i in range(self.capacity):
+            self._messages[i] = None
+            self._args1[i]    = None
+            self._args2[i]    = None
+        self._head  = 0
+        self._count = 0
+
+    def _record(self, level, message, arg1, arg2):
+        if self._count == self.capacity:       # Full, overwrite the oldest
+            self._head = (self._head + 1) % self.capacity
+            self._count = self._count - 1
+            self.dropped = self.dropped + 1
+        i = (self._head + self._count) % self.capacity
+        self._times[i]    = clock.now
+        self._levels[i]   = level
+        self._messages[i] = message
+        self._args1[i]    = arg1
+        self._args2[i]    = arg2
+        self._count = self._count + 1
+
+    def _print(self, ticks, level, message, arg1, arg2):
+        stamp = "[%d.%03d] %-5s" % (ticks // 1000, ticks % 1000, _LEVEL_NAMES.get(level, level))
+        if arg2 is not None:
+            print(stamp, message, arg1, arg2)
+        elif arg1 is not None:
+            print(stamp, message, arg1)
+        else:
+            print(stamp, message)
+
+# The log every module writes to
+log = EventLog()
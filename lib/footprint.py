@@ -0,0 +1,109 @@
+# ----------------------------------------------------------------------------
+# RAM footprint report for a configured show.
+#
+# Measures how much heap the triggers, action groups and actions of a show take
+# up, so it is clear how much room is left for a larger one. Build the show in a
+# function and measure it, then report on the objects it made:
+#
+#   from footprint import measure, report
+#   triggers, used = measure(build_show)
+#   report(triggers, used)
+#
+# measure() uses gc.mem_alloc() on CircuitPython/MicroPython and tracemalloc on
+# a desktop Python. The bytes per object in the report come from sys.getsizeof(),
+# so they are only shown on a desktop Python; CircuitPython ignores __slots__
+# and has no getsizeof, but the heap totals are exact there.
+#
+# License: MIT
+# ----------------------------------------------------------------------------
+
+import gc
+import sys
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+# Bytes of heap currently allocated, after a collection
+def heap_used():
+    gc.collect()
+    if hasattr(gc, "mem_alloc"):
+        return gc.mem_alloc()
+    if tracemalloc is not None and tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[0]
+    return 0
+
+# Bytes of heap left, or None if not known (desktop Python)
+def heap_free():
+    gc.collect()
+    if hasattr(gc, "mem_free"):
+        return gc.mem_free()
+    return None
+
+# Calls factory(*args) and returns (its result, bytes of heap the result kept)
+def measure(factory, *args):
+    started = False
+    if not hasattr(gc, "mem_alloc") and tracemalloc is not None and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        started = True
+    before = heap_used()
+    result = factory(*args)
+    used = heap_used() - before
+    if started:
+        tracemalloc.stop()
+    return result, used
+
+# Shallow size of one object in bytes, including its __dict__ if it has one.
+# Returns None where sys.getsizeof() is not available
+def object_size(obj):
+    if not hasattr(sys, "getsizeof"):
+        return None
+    size = sys.getsizeof(obj)
+    if hasattr(obj, "__dict__"):
+        size = size + sys.getsizeof(obj.__dict__)
+    return size
+
+# Every trigger, action group and action reachable from triggers, each once
+def show_objects(triggers):
+    found = []
+    seen = set()
+    pending = list(triggers)
+    while pending:
+        obj = pending.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        found.append(obj)
+        for attr in ("action_groups", "action_list"):
+            children = getattr(obj, attr, None)
+            if children is not None:
+                pending.extend(children)
+    return found
+
+# Print the number of objects of each class, bytes per object and, if given,
+# the total heap the show used (see measure)
+def report(triggers, used=None):
+    counts = {}
+    sizes = {}
+    for obj in show_objects(triggers):
+        name = obj.__class__.__name__
+        counts[name] = counts.get(name, 0) + 1
+        sizes[name] = object_size(obj)
+    print("%-24s %6s %8s" % ("class", "count", "bytes"))
+    total = 0
+    for name in sorted(counts):
+        size = sizes[name]
+        if size is None:
+            print("%-24s %6d %8s" % (name, counts[name], "-"))
+        else:
+            print("%-24s %6d %8d" % (name, counts[name], size))
+            total = total + size * counts[name]
+    if total:
+        print("objects alone:", total, "bytes")
+    if used is not None:
+        print("show total:", used, "bytes")
+    free = heap_free()
+    if free is not None:
+        print("heap free:", free, "bytes")
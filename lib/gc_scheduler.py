@@ -0,0 +1,92 @@
+# ----------------------------------------------------------------------------
+# Garbage collection scheduler.
+#
+# Left alone, the garbage collector runs whenever an allocation finds the heap
+# full, which is often in the middle of an animation frame or a servo sweep and
+# shows as a hitch. Instead, while any trigger is active automatic collection is
+# turned off, and the heap is collected at moments nobody will notice:
+#
+#   - right after the last active trigger stops (its ActionGroup has stopped)
+#   - in idle windows between triggers, at most every idle_interval seconds, when
+#     the main loop is about to sleep for at least min_idle seconds (between
+#     triggers the Scheduler sleeps up to its scan_interval at a time)
+#   - in an emergency, while a trigger is active, if the heap is more than
+#     threshold full (board only; a desktop Python doesn't report the heap size)
+#
+# Every collection's pause is written to the event log. Pass one to the
+# Scheduler, which calls update() before it sleeps:
+#
+#   scheduler = Scheduler(trigger_objects, players=[player],
+#                         collector=GCScheduler(trigger_objects))
+#
+# License: MIT
+# ----------------------------------------------------------------------------
+
+import gc
+
+from tick_clock import ticks_ms, ticks_diff, ms
+from event_log import log
+
+
+class GCScheduler:
+    def __init__(self, triggers, threshold=0.85, idle_interval=5.0, min_idle=0.005):
+        self.triggers       = list(triggers)
+        self.threshold      = threshold         # Fraction of the heap in use that forces a collection
+        self.threshold_pct  = int(threshold * 100) if threshold is not None else None
+        self.idle_ms        = ms(idle_interval) # Least time between collections while idle
+        self.min_idle_ms    = ms(min_idle)      # Shortest sleep worth collecting in
+        self.was_active     = False
+        self.last_collect   = ticks_ms()
+        self.collections    = 0
+        self.emergencies    = 0
+        self.total_pause_ms = 0
+        self.max_pause_ms   = 0
+
+    # True if any trigger is active
+    def any_active(self):
+        triggers = self.triggers
+        for i in range(len(triggers)):
+            if triggers[i].is_active():
+                return True
+        return False
+
+    # True if more than threshold of the heap is in use. Integer arithmetic, so
+    # checking on every pass allocates nothing
+    def heap_full(self):
+        if self.threshold_pct is None or not hasattr(gc, "mem_free"):
+            return False
+        used = gc.mem_alloc()
+        return used * 100 >= self.threshold_pct * (used + gc.mem_free())
+
+    # Call once per pass of the main loop, before sleeping for wait_ms milliseconds.
+    # Returns the number of milliseconds spent collecting
+    def update(self, wait_ms):
+        if self.any_active():
+            if not self.was_active:
+                gc.disable()
+                self.was_active = True
+            if self.heap_full():
+                self.emergencies = self.emergencies + 1
+                return self.collect("heap full")
+            return 0
+        if self.was_active:
+            self.was_active = False
+            gc.enable()
+            return self.collect("trigger stopped")
+        if wait_ms >= self.min_idle_ms and ticks_diff(ticks_ms(), self.last_collect) >= self.idle_ms:
+            return self.collect("idle")
+        return 0
+
+    # Collect now and log the pause. Returns its length in milliseconds
+    def collect(self, reason):
+        start = ticks_ms()
+        gc.collect()
+        now = ticks_ms()
+        pause = ticks_diff(now, start)
+        self.last_collect   = now
+        self.collections    = self.collections + 1
+        self.total_pause_ms = self.total_pause_ms + pause
+        if pause > self.max_pause_ms:
+            self.max_pause_ms = pause
+        log.info("gc pause (ms, reason):", pause, reason)
+        return pause
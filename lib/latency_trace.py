@@ -0,0 +1,137 @@
+# ----------------------------------------------------------------------------
+# Trigger to output latency tracing.
+#
+# What a kid notices is the time from pressing a button to hearing a sound or
+# seeing lights. While enabled, the tracer starts a trace each time a trigger
+# fires and stamps the time as the response reaches each stage:
+#
+#   STAGE_UPDATE        the trigger's update() (debouncer) that saw the press
+#   STAGE_TRIGGERED     is_triggered() returned True
+#   STAGE_RESPOND       respond_to_trigger() started
+#   STAGE_GROUP_START   the trigger's ActionGroup started
+#   STAGE_SOUND_START   an ActionSound started its track
+#   STAGE_UART_WRITE    the first command went out to a sound player after the
+#                       sound start (earlier writes, e.g. stopping the previous
+#                       sound or a status poll, don't count)
+#
+# Stamps are kept in a preallocated ring of traces, as microseconds after the
+# update stage. report() prints the median and 99th percentile time to reach
+# each stage, and spent in each stage, per trigger.
+#
+#   from latency_trace import tracer
+#   tracer.enable()
+#   ...
+#   tracer.report()
+#
+# Uses the same microsecond clock as the profiler, which allocates a little on
+# CircuitPython, so leave the tracer off in a finished toy.
+#
+# License: MIT
+# ----------------------------------------------------------------------------
+
+from profiler import now_us
+
+STAGE_UPDATE      = 0
+STAGE_TRIGGERED   = 1
+STAGE_RESPOND     = 2
+STAGE_GROUP_START = 3
+STAGE_SOUND_START = 4
+STAGE_UART_WRITE  = 5
+NUM_STAGES        = 6
+STAGE_NAMES       = ("update", "triggered", "respond", "group start", "sound start", "uart write")
+
+# Value of the p-th percentile (nearest rank) of a sorted list
+def percentile(ordered, p):
+    i = (p * len(ordered) + 99) // 100 - 1
+    return ordered[i if i > 0 else 0]
+
+
+class LatencyTracer:
+    def __init__(self, capacity=64):
+        self.enabled    = False
+        self.capacity   = capacity
+        self._triggers  = [None] * capacity             # Trigger of each trace
+        self._starts    = [0] * capacity                # now_us() of the update stage
+        self._stamps    = [-1] * (capacity * NUM_STAGES)    # Microseconds after start, -1 if not reached
+        self._next      = 0                             # Trace to use next
+        self._count     = 0
+        self._current   = -1                            # Trace being stamped, -1 if none
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+        self._current = -1
+
+    # Forget all traces
+    def reset(self):
+        for i in range(self.capacity):
+            self._triggers[i] = None
+        self._next    = 0
+        self._count   = 0
+        self._current = -1
+
+    # Start a trace for trigger. update_us is the now_us() at which its last update() started
+    def begin(self, trigger, update_us):
+        i = self._next
+        self._next  = (i + 1) % self.capacity
+        if self._count < self.capacity:
+            self._count = self._count + 1
+        self._triggers[i] = trigger
+        self._starts[i]   = update_us
+        base = i * NUM_STAGES
+        for s in range(NUM_STAGES):
+            self._stamps[base + s] = -1
+        self._stamps[base] = 0
+        self._current = i
+
+    # Stamp the time the current trace first reached stage
+    def stamp(self, stage):
+        if self._current < 0:
+            return
+        base = self._current * NUM_STAGES
+        if stage == STAGE_UART_WRITE and self._stamps[base + STAGE_SOUND_START] < 0:
+            return                                      # Not the new sound's command
+        i = base + stage
+        if self._stamps[i] < 0:
+            self._stamps[i] = now_us() - self._starts[self._current]
+        if stage == STAGE_UART_WRITE:                   # Output reached, nothing further to stamp
+            self._current = -1
+
+    # Print the latency percentiles per trigger and stage, in milliseconds
+    def report(self):
+        print("--- trigger latency (ms) ---")
+        print("%-16s %-12s %6s %8s %8s %8s %8s" % ("trigger", "stage", "traces",
+                                                   "at p50", "at p99", "in p50", "in p99"))
+        triggers = []
+        for i in range(self._count):
+            if self._triggers[i] not in triggers:
+                triggers.append(self._triggers[i])
+        for trigger in triggers:
+            for stage in range(1, NUM_STAGES):
+                reached = []                            # Time from the start to stage
+                spent = []                              # Time from the previous stage reached to stage
+                for i in range(self._count):
+                    if self._triggers[i] is not trigger:
+                        continue
+                    base = i * NUM_STAGES
+                    at = self._stamps[base + stage]
+                    if at < 0:
+                        continue
+                    previous = stage - 1
+                    while self._stamps[base + previous] < 0:
+                        previous = previous - 1
+                    reached.append(at)
+                    spent.append(at - self._stamps[base + previous])
+                if not reached:
+                    continue
+                reached.sort()
+                spent.sort()
+                print("%-16s %-12s %6d %8.2f %8.2f %8.2f %8.2f" % (
+                    getattr(trigger, "name", "?"), STAGE_NAMES[stage], len(reached),
+                    percentile(reached, 50) / 1000, percentile(reached, 99) / 1000,
+                    percentile(spent, 50) / 1000, percentile(spent, 99) / 1000))
+
+# The tracer the hooks report to
+tracer = LatencyTracer()
@@ -0,0 +1,167 @@
+# ----------------------------------------------------------------------------
+# Pixel compositor: several animations on one strip, one show() per tick.
+#
+# Every adafruit_led_animation animation calls show() on its pixel object each
+# frame, so a group with several animations on the same NeoPixel strip sends
+# the whole strip out several times a pass, and pushing the data out dominates
+# the loop. Instead, the compositor owns the strip and hands each animation a
+# layer that looks like a pixel object. Drawing on a layer and calling its
+# show() only marks the compositor dirty. Once per pass render() combines the
+# visible layers into the strip, in the order they were made, and calls the
+# strip's show() at most once.
+#
+#   pixels     = neopixel.NeoPixel(board.GP27, 9, brightness=0.2, auto_write=False)
+#   compositor = PixelCompositor(pixels)
+#   rainbow    = Rainbow(compositor.layer(), speed=0.3)
+#   sparkle    = Sparkle(compositor.layer(ADD), speed=0.1, color=(255,255,255))
+#   scheduler  = Scheduler(trigger_objects, players=[player], compositors=[compositor])
+#
+# Each layer combines with the layers below it by its blend mode:
+#   REPLACE   the layer's pixels replace what is below
+#   ADD       the colours are added, each channel saturating at 255
+#   MAX       the brighter of each channel is kept
+# A layer only counts once something is drawn on it, and clear() hides it
+# again, e.g. when its animation stops.
+#
+# License: MIT
+# ----------------------------------------------------------------------------
+
+REPLACE = 0
+ADD     = 1
+MAX     = 2
+
+# Colour as a 0xRRGGBB integer, from an integer or an (r, g, b) tuple
+def pack(color):
+    if isinstance(color, int):
+        return color & 0xffffff
+    return (color[0] << 16) | (color[1] << 8) | color[2]
+
+# Indexes covered by slice s of a sequence of length n (slice.indices() is not
+# available on every port)
+def slice_range(s, n):
+    step = 1 if s.step is None else s.step
+    if step < 0:
+        lower, upper = -1, n - 1
+    else:
+        lower, upper = 0, n
+    if s.start is None:
+        start = upper if step < 0 else lower
+    else:
+        start = s.start + n if s.start < 0 else s.start
+        start = max(min(start, upper), lower)
+    if s.stop is None:
+        stop = lower if step < 0 else upper
+    else:
+        stop = s.stop + n if s.stop < 0 else s.stop
+        stop = max(min(stop, upper), lower)
+    return range(start, stop, step)
+
+
+# A layer of the compositor with the pixel object interface animations use
+class PixelLayer:
+    __slots__ = ("compositor", "blend", "n", "bpp", "auto_write", "visible", "_colors")
+
+    def __init__(self, compositor, blend=REPLACE):
+        self.compositor = compositor
+        self.blend      = blend
+        self.n          = len(compositor.strip)
+        self.bpp        = 3
+        self.auto_write = False             # Drawing waits for show(), like the strip it stands in for
+        self.visible    = False             # Set by drawing, cleared by clear()
+        self._colors    = [0] * self.n      # 0xRRGGBB per pixel
+
+    def __len__(self):
+        return self.n
+
+    def __setitem__(self, index, color):
+        if isinstance(index, slice):
+            i = 0
+            for pixel in slice_range(index, self.n):
+                self._colors[pixel] = pack(color[i])
+                i = i + 1
+        else:
+            if index < 0:
+                index = index + self.n
+            self._colors[index] = pack(color)
+        self.visible = True
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[pixel] for pixel in slice_range(index, self.n)]
+        c = self._colors[index]
+        return ((c >> 16) & 0xff, (c >> 8) & 0xff, c & 0xff)
+
+    def fill(self, color):
+        c = pack(color)
+        colors = self._colors
+        for i in range(self.n):
+            colors[i] = c
+        self.visible = True
+
+    # Doesn't write to the strip, just asks the compositor to on its next render()
+    def show(self):
+        self.compositor.dirty = True
+
+    # Hide the layer until something is drawn on it again
+    def clear(self):
+        colors = self._colors
+        for i in range(self.n):
+            colors[i] = 0
+        self.visible = False
+        self.compositor.dirty = True
+
+    # Brightness is the strip's, shared by all its layers
+    @property
+    def brightness(self):
+        return self.compositor.strip.brightness
+
+    @brightness.setter
+    def brightness(self, value):
+        self.compositor.strip.brightness = value
+        self.compositor.dirty = True
+
+
+class PixelCompositor:
+    def __init__(self, strip):
+        self.strip      = strip             # The NeoPixel object (with auto_write=False)
+        self.layers     = []                # Bottom layer first
+        self.dirty      = False
+        self.shows      = 0                 # Number of times the strip was sent out
+
+    # Add a layer on top of the existing ones and return it, to pass to an
+    # animation in place of the strip
+    def layer(self, blend=REPLACE):
+        new_layer = PixelLayer(self, blend)
+        self.layers.append(new_layer)
+        return new_layer
+
+    # Combine the layers into the strip and show it, if any layer changed since the
+    # last render. Call once per pass of the main loop (the Scheduler does).
+    # Returns True if the strip was shown
+    def render(self):
+        if not self.dirty:
+            return False
+        self.dirty = False
+        strip  = self.strip
+        layers = self.layers
+        for i in range(len(strip)):
+            c = 0
+            for j in range(len(layers)):
+                layer = layers[j]
+                if not layer.visible:
+                    continue
+                top = layer._colors[i]
+                if layer.blend == REPLACE:
+                    c = top
+                elif layer.blend == ADD:
+                    r = ((c >> 16) & 0xff) + ((top >> 16) & 0xff)
+                    g = ((c >> 8) & 0xff) + ((top >> 8) & 0xff)
+                    b = (c & 0xff) + (top & 0xff)
+                    c = (min(r, 0xff) << 16) | (min(g, 0xff) << 8) | min(b, 0xff)
+                else:
+                    c = (max(c & 0xff0000, top & 0xff0000) | max(c & 0xff00, top & 0xff00)
+                         | max(c & 0xff, top & 0xff))
+            strip[i] = c
+        strip.show()
+        self.shows = self.shows + 1
+        return True
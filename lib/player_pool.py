@@ -0,0 +1,99 @@
+# ----------------------------------------------------------------------------
+# A pool of DYPlayer objects, each driving its own DY-SV5W module on its own
+# UART, used as voices so several sounds can play at once.
+#
+# Pass the pool instead of a DYPlayer to ActionSound. Each time the sound starts
+# it is given a free voice. When all voices are busy, the voice playing the
+# lowest priority sound (the oldest one among equals) is stolen, as long as its
+# priority is not higher than the new sound's. Every module needs a copy of the
+# same sound files, so any track can play on any voice, and the same track can
+# play on several voices at once.
+#
+# License: MIT
+# ----------------------------------------------------------------------------
+
+from tick_clock import ticks_ms, ticks_diff
+
+
+class PlayerPool:
+    def __init__(self, *players):
+        if len(players) < 1:
+            raise ValueError("PlayerPool requires at least one player")
+        self.players        = list(players)
+        self._owners        = [None] * len(players)     # Object currently using each voice
+        self._priorities    = [0] * len(players)
+        self._start_times   = [0] * len(players)         # Ticks each voice was acquired
+        self.steals         = 0                         # Number of voices taken from a playing sound
+
+    # --- give owner a voice to play on. Returns the DYPlayer, or None if every voice
+    # is playing a sound with a higher priority
+    def acquire(self, owner, priority=0):
+        voice = self._voice_of(owner)
+        if voice < 0:
+            voice = self._free_voice()
+        if voice < 0:
+            voice = self._steal_voice(priority)
+            if voice < 0:
+                return None
+            self.steals = self.steals + 1
+        self._owners[voice]      = owner
+        self._priorities[voice]  = priority
+        self._start_times[voice] = ticks_ms()
+        return self.players[voice]
+
+    # --- hand back the voice held by owner, if it still holds one ---------------
+    def release(self, owner):
+        voice = self._voice_of(owner)
+        if voice >= 0:
+            self._owners[voice] = None
+
+    # Returns True if owner still holds player (it has not been stolen)
+    def owns(self, owner, player):
+        voice = self._voice_of(owner)
+        return voice >= 0 and self.players[voice] is player
+
+    # Number of voices not in use
+    def free_voices(self):
+        return self._owners.count(None)
+
+    # Call once per main loop tick in place of DYPlayer.poll()
+    def poll(self):
+        for i in range(len(self.players)):
+            self.players[i].poll()
+
+    # Milliseconds until any voice next needs poll(), or None if all are idle (see Scheduler)
+    def nextPollMs(self):
+        delay = None
+        for i in range(len(self.players)):
+            d = self.players[i].nextPollMs()
+            if d is not None and (delay is None or d < delay):
+                delay = d
+        return delay
+
+    def stop(self):
+        for i in range(len(self.players)):
+            self.players[i].stop()
+            self._owners[i] = None
+
+    def _voice_of(self, owner):
+        for i in range(len(self._owners)):
+            if self._owners[i] is owner:
+                return i
+        return -1
+
+    def _free_voice(self):
+        for i in range(len(self._owners)):
+            if self._owners[i] is None:
+                return i
+        return -1
+
+    def _steal_voice(self, priority):
+        best = -1
+        for i in range(len(self._owners)):
+            if self._priorities[i] > priority:
+                continue
+            if (best < 0 or self._priorities[i] < self._priorities[best]
+                    or (self._priorities[i] == self._priorities[best]
+                        and ticks_diff(self._start_times[i], self._start_times[best]) < 0)):
+                best = i
+        return best
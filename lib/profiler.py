@@ -0,0 +1,163 @@
+# ----------------------------------------------------------------------------
+# Opt-in profiler for the main loop's hot paths.
+#
+# While enabled it times every Action.action(), TriggerObject.update() and
+# TriggerObject.is_triggered() call made through do_action(), do_update() and
+# check_triggered(), and every pass of the main loop made through
+# Scheduler.wait(). For each action and trigger it keeps the call count, total
+# and longest duration and a histogram over fixed buckets; for the loop it
+# keeps the pass rate, the period jitter and a histogram of the busy time per
+# pass. While disabled each hook costs one attribute check.
+#
+#   from profiler import profiler
+#   profiler.enable()
+#   ...
+#   profiler.report()       # e.g. from a button callback or the REPL
+#
+# Durations are in microseconds from time.monotonic_ns(), which allocates a
+# little on CircuitPython, so leave the profiler off in a finished toy.
+#
+# License: MIT
+# ----------------------------------------------------------------------------
+
+import time
+
+ACTION      = 0         # Action.action()
+UPDATE      = 1         # TriggerObject.update()
+TRIGGERED   = 2         # TriggerObject.is_triggered()
+_KIND_NAMES = ("action", "update", "triggered")
+
+# Histogram bucket upper limits in microseconds. The last bucket holds anything longer
+BUCKETS_US  = (100, 250, 500, 1000, 2500, 5000, 10000, 25000)
+_NUM_BUCKETS = len(BUCKETS_US) + 1
+
+if hasattr(time, "monotonic_ns"):
+    def now_us():
+        return time.monotonic_ns() // 1000
+else:
+    def now_us():
+        return int(time.monotonic() * 1000000)
+
+# Index of the histogram bucket for a duration in microseconds
+def bucket(took):
+    for i in range(len(BUCKETS_US)):
+        if took <= BUCKETS_US[i]:
+            return i
+    return len(BUCKETS_US)
+
+
+class Profiler:
+    def __init__(self):
+        self.enabled    = False
+        self._slots     = ({}, {}, {})      # Per kind, profiled object -> slot index
+        self._names     = []                # Per slot
+        self._kinds     = []
+        self._counts    = []
+        self._totals    = []                # Microseconds
+        self._maxes     = []
+        self._hist      = []                # _NUM_BUCKETS entries per slot
+        self.reset_loop()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    # Forget everything measured so far
+    def reset(self):
+        for i in range(len(self._counts)):
+            self._counts[i] = 0
+            self._totals[i] = 0
+            self._maxes[i]  = 0
+        for i in range(len(self._hist)):
+            self._hist[i] = 0
+        self.reset_loop()
+
+    def reset_loop(self):
+        self.passes         = 0
+        self.last_wake      = -1            # Microseconds, -1 before the first pass
+        self.period_total   = 0
+        self.period_max     = 0
+        self.period_min     = -1
+        self.period_squares = 0.0           # Sum of squared periods, for the jitter
+        self.busy_hist      = [0] * _NUM_BUCKETS
+
+    # Start timing a call. Pass the result to end()
+    def begin(self):
+        return now_us()
+
+    # Finish timing a call of the given kind made by obj
+    def end(self, kind, obj, start):
+        took = now_us() - start
+        slot = self._slots[kind].get(obj)
+        if slot is None:
+            slot = self._add_slot(kind, obj)
+        self._counts[slot] = self._counts[slot] + 1
+        self._totals[slot] = self._totals[slot] + took
+        if took > self._maxes[slot]:
+            self._maxes[slot] = took
+        i = slot * _NUM_BUCKETS + bucket(took)
+        self._hist[i] = self._hist[i] + 1
+
+    # Called by Scheduler.wait() just before sleeping: the pass is over
+    def loop_sleep(self):
+        if self.last_wake >= 0:
+            i = bucket(now_us() - self.last_wake)
+            self.busy_hist[i] = self.busy_hist[i] + 1
+
+    # Called by Scheduler.wait() on waking: the next pass starts
+    def loop_wake(self):
+        now = now_us()
+        if self.last_wake >= 0:
+            period = now - self.last_wake
+            self.passes         = self.passes + 1
+            self.period_total   = self.period_total + period
+            self.period_squares = self.period_squares + period * period
+            if period > self.period_max:
+                self.period_max = period
+            if self.period_min < 0 or period < self.period_min:
+                self.period_min = period
+        self.last_wake = now
+
+    # Returns (passes per second, mean period, period standard deviation), periods in microseconds
+    def loop_stats(self):
+        if self.passes == 0:
+            return (0, 0, 0)
+        mean = self.period_total / self.passes
+        variance = self.period_squares / self.passes - mean * mean
+        return (1000000 / mean if mean > 0 else 0, mean, variance ** 0.5 if variance > 0 else 0)
+
+    # Print everything measured so far
+    def report(self):
+        print("--- profile (us) ---")
+        print("%-9s %-24s %7s %9s %7s %7s  %s" % ("kind", "name", "count", "total", "mean", "max",
+                                               "histogram <=" + ",".join(str(b) for b in BUCKETS_US) + ",more"))
+        for slot in range(len(self._names)):
+            count = self._counts[slot]
+            if count == 0:
+                continue
+            start = slot * _NUM_BUCKETS
+            print("%-9s %-24s %7d %9d %7d %7d  %s" % (
+                _KIND_NAMES[self._kinds[slot]], self._names[slot], count, self._totals[slot],
+                self._totals[slot] // count, self._maxes[slot],
+                " ".join(str(n) for n in self._hist[start:start + _NUM_BUCKETS])))
+        rate, mean, jitter = self.loop_stats()
+        if self.passes:
+            print("loop: %d passes, %.1f per second, period mean %d min %d max %d jitter %d"
+                  % (self.passes, rate, mean, self.period_min, self.period_max, jitter))
+            print("busy per pass histogram:", " ".join(str(n) for n in self.busy_hist))
+
+    def _add_slot(self, kind, obj):
+        slot = len(self._names)
+        self._slots[kind][obj] = slot
+        self._names.append(getattr(obj, "name", obj.__class__.__name__))
+        self._kinds.append(kind)
+        self._counts.append(0)
+        self._totals.append(0)
+        self._maxes.append(0)
+        self._hist.extend([0] * _NUM_BUCKETS)
+        return slot
+
+# The profiler the hooks report to
+profiler = Profiler()
@@ -0,0 +1,151 @@
+# ----------------------------------------------------------------------------
+# Deadline scheduler for the main loop.
+#
+# Instead of spinning as fast as possible, the main loop calls scheduler.wait()
+# at the end of each pass. Every trigger reports when its playing actions next
+# need an update (TriggerObject.next_wake) and every sound player when it next
+# has commands to send (DYPlayer.nextPollMs). The scheduler keeps these
+# deadlines in a heap and sleeps until the earliest one, or until the next input
+# scan, whichever comes first. Inputs are still scanned every scan_interval
+# seconds, which bounds the response latency to a button press. Waiting log
+# records (see event_log) are printed in the time that would otherwise be slept.
+# With the profiler enabled, wait() also measures the loop rate (see profiler).
+# Given a collector (see gc_scheduler), wait() lets it collect garbage before
+# sleeping too, and given pixel compositors (see pixel_compositor) it shows each
+# changed strip once at the end of the pass.
+#
+#   scheduler = Scheduler(trigger_objects, players=[player])
+#   while True:
+#       clock.tick()
+#       ...
+#       scheduler.wait()
+#
+# License: MIT
+# ----------------------------------------------------------------------------
+
+import time
+
+from tick_clock import clock, ms, ticks_ms, ticks_diff
+from event_log import log
+from profiler import profiler
+
+# time.sleep_ms takes an integer, so sleeping doesn't create a float
+if hasattr(time, "sleep_ms"):
+    _sleep_ms = time.sleep_ms
+else:
+    def _sleep_ms(wait_ms):
+        time.sleep(wait_ms / 1000)
+
+
+# Binary min-heap of (deadline, item) pairs stored in two parallel preallocated
+# lists, so pushing and popping allocates nothing
+class DeadlineHeap:
+    def __init__(self, capacity):
+        self._keys  = [0] * capacity
+        self._items = [None] * capacity
+        self.count  = 0
+
+    def clear(self):
+        for i in range(self.count):
+            self._items[i] = None
+        self.count = 0
+
+    def push(self, key, item):
+        if self.count == len(self._keys):
+            raise IndexError("deadline heap is full")
+        i = self.count
+        self.count = self.count + 1
+        while i > 0:                        # Sift up
+            parent = (i - 1) // 2
+            if self._keys[parent] <= key:
+                break
+            self._keys[i]  = self._keys[parent]
+            self._items[i] = self._items[parent]
+            i = parent
+        self._keys[i]  = key
+        self._items[i] = item
+
+    # Earliest deadline, or None if empty
+    def peek_key(self):
+        return self._keys[0] if self.count else None
+
+    def peek_item(self):
+        return self._items[0] if self.count else None
+
+    def pop(self):
+        item = self._items[0]
+        self.count = self.count - 1
+        key  = self._keys[self.count]
+        last = self._items[self.count]
+        self._items[self.count] = None
+        i = 0
+        while True:                         # Sift down
+            child = 2 * i + 1
+            if child >= self.count:
+                break
+            if child + 1 < self.count and self._keys[child + 1] < self._keys[child]:
+                child = child + 1
+            if key <= self._keys[child]:
+                break
+            self._keys[i]  = self._keys[child]
+            self._items[i] = self._items[child]
+            i = child
+        if self.count:
+            self._keys[i]  = key
+            self._items[i] = last
+        return item
+
+
+class Scheduler:
+    def __init__(self, triggers, players=(), scan_interval=0.01, collector=None, compositors=()):
+        self.triggers       = list(triggers)
+        self.players        = list(players)
+        self.scan_ms        = ms(scan_interval)     # Longest time between input scans
+        self.heap           = DeadlineHeap(len(self.triggers) + len(self.players) + 1)
+        self.slept_ms       = 0                     # Total time spent sleeping, for measuring load
+        self.collector      = collector             # GCScheduler, or None to leave gc alone
+        self.compositors    = list(compositors)     # PixelCompositors to render once per pass
+
+    # Milliseconds until the earliest deadline, after rebuilding the heap.
+    # The input scan and trigger wakes count from clock.now, taken at the start of
+    # the pass, so the time the pass has taken since is subtracted from them.
+    # Players count from the real time already
+    def next_deadline(self):
+        heap = self.heap
+        heap.clear()
+        spent = ticks_diff(ticks_ms(), clock.now)
+        if spent < 0:
+            spent = 0
+        heap.push(self.scan_ms - spent if self.scan_ms > spent else 0, self)   # Next input scan
+        triggers = self.triggers
+        for i in range(len(triggers)):
+            wake = triggers[i].next_wake()
+            if wake is not None:
+                heap.push(wake - spent if wake > spent else 0, triggers[i])
+        players = self.players
+        for i in range(len(players)):
+            delay = players[i].nextPollMs()
+            if delay is not None:
+                heap.push(delay, players[i])
+        return heap.peek_key()
+
+    # Sleep until something needs attention. Returns the number of ms slept
+    def wait(self):
+        compositors = self.compositors
+        for i in range(len(compositors)):
+            compositors[i].render()
+        if profiler.enabled:
+            profiler.loop_sleep()
+        wait_ms = self.next_deadline()
+        if log.pending() and (wait_ms > 0 or log.needs_flush()):
+            start = ticks_ms()
+            log.flush()
+            wait_ms = wait_ms - ticks_diff(ticks_ms(), start)
+        if self.collector is not None:
+            wait_ms = wait_ms - self.collector.update(wait_ms)
+        if wait_ms > 0:
+            _sleep_ms(wait_ms)
+            self.slept_ms = self.slept_ms + wait_ms
+        if profiler.enabled:
+            profiler.loop_wake()
+        return wait_ms
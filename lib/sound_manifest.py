@@ -0,0 +1,83 @@
+# ----------------------------------------------------------------------------
+# Run time reader for the sound manifest written by tools/build_sound_manifest.py
+#
+# The manifest is a header followed by one fixed size record per track, in track
+# order, so the record for a track is found with a single seek. Records are read
+# from the open file on demand into a preallocated buffer; the index is never
+# loaded into RAM as a whole.
+#
+#   manifest = SoundManifest("/sounds.dym")
+#   manifest.duration(3)        # seconds
+#
+# License: MIT
+# ----------------------------------------------------------------------------
+
+import struct
+
+from event_log import log
+
+MAGIC           = b"DYSM"
+VERSION         = 1
+PATH_SIZE       = 40
+HEADER_FORMAT   = "<4sBHHH"                     # magic, version, record size, tracks, folders
+RECORD_FORMAT   = "<HHI%ds" % PATH_SIZE         # track, folder index, duration (ms), path
+
+
+class SoundManifest:
+    def __init__(self, filename):
+        self._file = open(filename, "rb")
+        header = self._file.read(struct.calcsize(HEADER_FORMAT))
+        magic, version, record_size, count, folders = struct.unpack(HEADER_FORMAT, header)
+        if magic != MAGIC or version != VERSION:
+            self._file.close()
+            raise ValueError("not a version %d sound manifest: %s" % (VERSION, filename))
+        self._header_size   = len(header)
+        self._record_size   = record_size
+        self._record        = bytearray(record_size)
+        self._track         = 0             # Track currently held in _record
+        self.count          = count         # Number of tracks on the card
+        self.folder_count   = folders
+
+    # --- read the record for track into the record buffer ------------------------
+    def _load(self, track):
+        if track < 1 or track > self.count:
+            raise IndexError("track %d not in manifest" % track)
+        if track != self._track:
+            self._file.seek(self._header_size + (track - 1) * self._record_size)
+            self._file.readinto(self._record)
+            self._track = track
+
+    # Duration of a track in milliseconds
+    def duration_ms(self, track):
+        self._load(track)
+        return struct.unpack_from("<I", self._record, 4)[0]
+
+    # Duration of a track in seconds
+    def duration(self, track):
+        return self.duration_ms(track) / 1000
+
+    # Index of the folder holding a track, in the order folders appear on the card
+    def folder(self, track):
+        self._load(track)
+        return struct.unpack_from("<H", self._record, 2)[0]
+
+    # Path of a track on the card, e.g. "/SOUNDS/00001.MP3"
+    def path(self, track):
+        self._load(track)
+        end = self._record.find(b"\x00", 8)
+        return bytes(self._record[8:end if end >= 0 else len(self._record)]).decode()
+
+    # Check the manifest matches the card in the player. Blocks while the player
+    # is queried, so call it at start up rather than in the main loop
+    def verify(self, player):
+        num_songs = player.queryNumSongs()
+        if num_songs is None:
+            log.warning("could not read the number of songs to verify the manifest")
+            return False
+        if num_songs != self.count:
+            log.warning("manifest track count does not match the player (manifest, player):", self.count, num_songs)
+            return False
+        return True
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,73 @@
+# ----------------------------------------------------------------------------
+# Shared integer millisecond clock for actions and triggers.
+#
+# Float time.monotonic() loses precision after a few days of uptime on
+# CircuitPython, and calling it separately in every action gives slightly
+# different times within one pass of the main loop. Instead, the main loop calls
+# clock.tick() once per pass, and every action and trigger reads the snapshot in
+# clock.now during that pass.
+#
+# Tick values are milliseconds that wrap around every 2**29 ms (about 6 days) so
+# they stay small integers that never allocate. Always compare them with
+# ticks_diff(), which is correct across the wrap for intervals up to about 3 days.
+#
+#   from tick_clock import clock
+#   while True:
+#       now = clock.tick()
+#       ...
+#
+# License: MIT
+# ----------------------------------------------------------------------------
+
+import time
+
+_TICKS_PERIOD       = 1 << 29
+_TICKS_MAX          = _TICKS_PERIOD - 1
+_TICKS_HALFPERIOD   = _TICKS_PERIOD // 2
+
+try:
+    from supervisor import ticks_ms
+except ImportError:
+    # No supervisor module (e.g. testing on a desktop Python)
+    def ticks_ms():
+        return (time.monotonic_ns() // 1000000) & _TICKS_MAX
+
+# Ticks value delta milliseconds after ticks
+def ticks_add(ticks, delta):
+    return (ticks + delta) & _TICKS_MAX
+
+# Signed number of milliseconds from ticks2 to ticks1
+def ticks_diff(ticks1, ticks2):
+    diff = (ticks1 - ticks2) & _TICKS_MAX
+    return ((diff + _TICKS_HALFPERIOD) & _TICKS_MAX) - _TICKS_HALFPERIOD
+
+# Longest age kept by ticks_age_limit(): far longer than any interval the
+# library waits for, and well inside the range of ticks_diff()
+TICKS_MAX_AGE       = 24 * 3600 * 1000
+
+# A timestamp that is only refreshed on activity can sit unchanged for days,
+# until ticks_diff() wraps and sees it in the future. Returns ticks, or the time
+# limit milliseconds before now if ticks is older than that (or has already
+# wrapped). Call regularly and store the result back
+def ticks_age_limit(ticks, now, limit=TICKS_MAX_AGE):
+    age = ticks_diff(now, ticks)
+    if age > limit or age < 0:
+        return ticks_add(now, -limit)
+    return ticks
+
+# Convert a duration in seconds to whole milliseconds
+def ms(seconds):
+    return int(seconds * 1000 + 0.5)
+
+
+class TickClock:
+    def __init__(self):
+        self.now = ticks_ms()
+
+    # Take the time snapshot for this pass of the main loop
+    def tick(self):
+        self.now = ticks_ms()
+        return self.now
+
+# The clock every action and trigger reads
+clock = TickClock()
@@ -1,13 +1,24 @@
 from action_object.action_group import ActionGroup
+from tick_clock import clock, ticks_diff, ms
+from event_log import log
+from profiler import profiler, now_us, UPDATE, TRIGGERED
+from latency_trace import tracer, STAGE_TRIGGERED, STAGE_RESPOND
 import random
 
 
 # Abstract base class for all triggers. Can be a button/toggle switch/sensor or any input
 # that changes state
 class TriggerObject:
+    # Instances have no __dict__ on CPython. Child classes list the attributes
+    # they add in their own __slots__
+    __slots__ = ("name", "action_groups", "allow_restart", "random_actions", "action_index",
+                 "current_action", "start_callback", "stop_callback", "max_rate", "min_interval_ms",
+                 "last_update_time", "first_update_time", "update_count", "update_us")
 
     # Instance functions
-    def __init__(self, name, action_groups, allow_restart=True, random_actions=False):
+    # max_rate is the most times per second update() needs calling. do_update()
+    # skips the calls in between. None means every call
+    def __init__(self, name, action_groups, allow_restart=True, random_actions=False, max_rate=None):
 
 
         trigger_actions = []        # list of actions corresponding to trigger
@@ -34,6 +45,12 @@ class TriggerObject:
         self.current_action         = self.action_groups[self.action_index] if len(self.action_groups) > 0 else None
         self.start_callback         = None
         self.stop_callback          = None
+        self.max_rate               = max_rate
+        self.min_interval_ms        = ms(1 / max_rate) if max_rate else 0
+        self.last_update_time       = -1                # Ticks of the last update() call, -1 if none
+        self.first_update_time      = -1
+        self.update_count           = 0
+        self.update_us              = 0                 # now_us() of the last update() while tracing latency
 
 
     # Must be overridden in child class
@@ -45,6 +62,45 @@ class TriggerObject:
     def update(self):
         pass
 
+    # Call this method in the main loop. Calls update() at most max_rate times a second
+    def do_update(self):
+        now = clock.now
+        if self.last_update_time >= 0:
+            if self.min_interval_ms and ticks_diff(now, self.last_update_time) < self.min_interval_ms:
+                return
+        else:
+            self.first_update_time = now
+        self.last_update_time = now
+        self.update_count     = self.update_count + 1
+        if tracer.enabled:
+            self.update_us = now_us()
+        if profiler.enabled:
+            start = profiler.begin()
+            self.update()
+            profiler.end(UPDATE, self, start)
+        else:
+            self.update()
+
+    # Call this method in the main loop in place of is_triggered()
+    def check_triggered(self):
+        if profiler.enabled:
+            start = profiler.begin()
+            triggered = self.is_triggered()
+            profiler.end(TRIGGERED, self, start)
+        else:
+            triggered = self.is_triggered()
+        if triggered and tracer.enabled:
+            tracer.begin(self, self.update_us)
+            tracer.stamp(STAGE_TRIGGERED)
+        return triggered
+
+    # Returns (requested, achieved) update() rates in calls per second.
+    # requested is None if the rate is not limited
+    def rate_report(self):
+        elapsed = ticks_diff(clock.now, self.first_update_time) if self.first_update_time >= 0 else 0
+        achieved = (self.update_count - 1) * 1000 / elapsed if elapsed > 0 else 0
+        return (self.max_rate, achieved)
+
     # Move to the next item in the list of action groups
     def advance(self):
         #print("in advance trigger", self.name)
@@ -67,17 +123,24 @@ class TriggerObject:
         else:
             return False
 
+    # Milliseconds until the trigger's active actions next need play() to be
+    # called, or None if nothing is playing. Inputs are scanned separately
+    # (see Scheduler)
+    def next_wake(self):
+        if self.current_action is not None and self.current_action.is_active():
+            return self.current_action.next_wake()
+        return None
+
     def start(self):
-        print("starting trigger ", self.name)
+        log.info("starting trigger", self.name)
 		# Invoke callback function if any exists
         if self.start_callback is not None:
             self.start_callback(self)
         if self.current_action is not None:
             self.current_action.start()
-        print("")
 
     def stop(self, set_next_action=True):
-        print("stopping trigger ", self.name)
+        log.info("stopping trigger", self.name)
 		# Invoke callback function if any exists
         if self.stop_callback is not None:
             self.stop_callback(self)
@@ -85,7 +148,6 @@ class TriggerObject:
             self.current_action.stop()
         if set_next_action:
             self.advance()
-        print("")
 
     def toggle(self):
         if self.is_active():
@@ -94,6 +156,8 @@ class TriggerObject:
             self.start()
 
     def respond_to_trigger(self):
+        if tracer.enabled:
+            tracer.stamp(STAGE_RESPOND)
         if self.is_active():
             #print(" Trigger ", self.name, " pressed while active and self.allow_restart is ", self.allow_restart)
             self.stop()
@@ -128,6 +192,38 @@ class TriggerObject:
     def set_stop_callback(self, callback_func):
         self.stop_callback = callback_func
 
+
+# Trigger types by class name, and the module each one lives in. Modules are only
+# imported (along with the drivers they need, e.g. adafruit_hcsr04) when a type is
+# first asked for, so a toy doesn't pay the boot time and RAM of unused triggers
+TRIGGER_TYPES = {
+    "ButtonTrigger":    "trigger_object.button_trigger",
+    "IrTrigger":        "trigger_object.ir_trigger",
+    "PingTrigger":      "trigger_object.ping_trigger",
+    "ToggleTrigger":    "trigger_object.toggle_trigger",
+}
+_trigger_classes = {}
+
+# Returns the trigger class called name, importing its module on first use
+def trigger_type(name):
+    cls = _trigger_classes.get(name)
+    if cls is None:
+        if name not in TRIGGER_TYPES:
+            raise ValueError("unknown trigger type " + name)
+        module = __import__(TRIGGER_TYPES[name], None, None, (name,))
+        cls = getattr(module, name)
+        _trigger_classes[name] = cls
+    return cls
+
+# Creates a trigger of the type called name
+def make_trigger(name, *args, **kwargs):
+    return trigger_type(name)(*args, **kwargs)
+
+# Adds a trigger type defined outside this package, e.g. register_trigger("TiltTrigger", "tilt_trigger")
+def register_trigger(name, module):
+    TRIGGER_TYPES[name] = module
+    _trigger_classes.pop(name, None)
+
 '''
 class TargetedTriggerObject(TriggerObject):
     def __init__(self, name, actions, targets, allow_restart=True, random_actions=False):
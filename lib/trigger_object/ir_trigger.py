@@ -5,6 +5,7 @@ from adafruit_debouncer import Debouncer
 
 # Trigger object is a push button (triggers on press)
 class IrTrigger(TriggerObject):
+    __slots__ = ("switch",)
 
     def __init__(self, name, pin, button_actions, random_actions=False, allow_restart=True):
         # Create a debounced button object
@@ -1,43 +1,49 @@
 from trigger_object import TriggerObject
 
-import time
+from tick_clock import clock, ticks_add, ticks_diff, ticks_age_limit
+from event_log import log
 import adafruit_hcsr04
 from adafruit_debouncer import Debouncer
 
 
 class PingTrigger(TriggerObject):
+    __slots__ = ("sonar", "last_trigger_time", "cutoff_distance", "current_distance", "switch")
 
     def __init__(self, name, trigger_pin, echo_pin, cutoff_distance, button_actions, random_actions=False, allow_restart=True):
         self.name               = name
         self.sonar              = adafruit_hcsr04.HCSR04(trigger_pin=trigger_pin,echo_pin=echo_pin)
-        self.last_read_time     = 0
-        self.last_trigger_time  = 0
+        self.last_trigger_time  = ticks_add(clock.now, -1000)  # Ticks, set in the past so the first trigger counts
         self.cutoff_distance    = cutoff_distance
         self.current_distance   = 100
-        self.switch             = Debouncer(lambda: self.current_distance < self.cutoff_distance, interval=0.1)
-        super().__init__(name, button_actions, random_actions=random_actions, allow_restart=allow_restart)
+        self.switch             = Debouncer(self.is_close, interval=0.1)
+        # Limit how frequently distance is checked
+        super().__init__(name, button_actions, random_actions=random_actions, allow_restart=allow_restart, max_rate=20)
         #print("initializing ping sensor", name)
 
     def update(self):
+        # Only set when triggered, so keep it from getting too old for ticks_diff()
+        self.last_trigger_time = ticks_age_limit(self.last_trigger_time, clock.now)
         self.checkDistance()
 
     def is_triggered (self):
         #print("triggered")
         response = False
-        now = time.monotonic()
-        if now - self.last_trigger_time > 0.3:
+        now = clock.now
+        since = ticks_diff(now, self.last_trigger_time)
+        if since > 300 or since < 0:                # Negative if it has wrapped, long ago
             response = self.switch.rose
         if response:
             self.last_trigger_time = now
         return response
 
+    # Condition debounced by switch
+    def is_close(self):
+        return self.current_distance < self.cutoff_distance
+
     def checkDistance(self):
-        now = time.monotonic()
-        if now - self.last_read_time > 0.05:  # Limit how frequently distance is checked
-            try:
-                self.current_distance = self.sonar.distance
-                #print(self.current_distance)
-                self.switch.update()
-                self.last_read_time = now
-            except:
-                print(self.name, "update failed")
+        try:
+            self.current_distance = self.sonar.distance
+            #print(self.current_distance)
+            self.switch.update()
+        except:
+            log.warning("update failed", self.name)
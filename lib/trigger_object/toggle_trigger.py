@@ -5,6 +5,7 @@ from adafruit_debouncer import Debouncer
 
 # Trigger object is a toggle switch (triggers on flip)
 class ToggleTrigger(TriggerObject):
+    __slots__ = ("switch", "toggle_both")
 
     def __init__(self, name, pin, button_actions, random_actions=False, allow_restart=False, toggle_both=True):
         # Create a debounced button object
@@ -0,0 +1,164 @@
+# ----------------------------------------------------------------------------
+# Checks that the main loop allocates no heap memory once a show is running.
+# Runs the same pass as the examples (triggers, an active ActionGroup with a
+# sound and a servo action, the sound player and the scheduler) without
+# sleeping, first with nothing triggered and then with a trigger active, and
+# counts the heap allocations per pass. The actions are the library's own; only
+# the UART and the servo are stand-ins. Exits with an error if there are any.
+#
+# On the board, copy it to the board with the lib folder and run it as
+# code.py. Or run it under the MicroPython unix port:
+#
+#   MICROPYPATH=lib micropython tools/alloc_check.py
+#
+# Either way the collector is disabled while measuring, so gc.mem_alloc() sees
+# every allocation, and only these runs can report OK.
+#
+# On a desktop Python:
+#
+#   python tools/alloc_check.py
+#
+# tracemalloc only sees memory still held after the passes, not objects that
+# are freed straight away, so this catches growth (lists that keep getting
+# longer, objects kept per pass) but not short-lived garbage. Without growth it
+# reports INCONCLUSIVE and exits with status 2, never OK. Growth of a few blocks
+# per source line that doesn't scale with the number of passes is ignored (see
+# NOISE_BLOCKS).
+# ----------------------------------------------------------------------------
+
+import gc
+import sys
+
+if hasattr(gc, "mem_alloc"):
+    tracemalloc = None                  # On the board or the MicroPython unix port
+else:
+    import tracemalloc
+
+if tracemalloc is not None:
+    import os
+    LIB_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib"))
+    sys.path.insert(0, LIB_DIR)
+
+from tick_clock import clock, ticks_ms
+from event_log import log
+from dyplayer import DYPlayer
+from scheduler import Scheduler
+from action_object.action_group import ActionGroup
+from action_object.action_servo import ActionServo
+from action_object.action_sound import ActionSound
+from trigger_object import TriggerObject
+
+WARMUP  = 200               # Passes before measuring, so one-time allocations are not counted
+PASSES  = 1000              # Passes measured per phase
+NOISE_BLOCKS = 8            # tracemalloc only: a few more live ints (the latest timestamps and
+                            # counters) at the end than at the start is not growth
+
+# Accepts writes and throws them away, so nothing outside the library allocates
+class NullUart():
+    in_waiting = 0
+
+    def write(self, buf):
+        return len(buf)
+
+# Stands in for an adafruit_motor servo: takes the angle and does nothing with it
+class NullServo():
+    angle = None
+
+# Fires once each time pressed is set
+class ScriptedTrigger(TriggerObject):
+    __slots__ = ("pressed",)
+
+    def __init__(self, name, action_groups):
+        self.pressed = False
+        super().__init__(name, action_groups)
+
+    def is_triggered(self):
+        pressed = self.pressed
+        self.pressed = False
+        return pressed
+
+player    = DYPlayer(uart=NullUart())
+servo     = ActionServo("Servo", NullServo(), period=0.5)
+triggers  = [ScriptedTrigger("A", [ActionGroup(ActionGroup.INFINITE, ActionSound(player, 3), servo)]),
+             ScriptedTrigger("B", [ActionGroup(2, ActionSound(player, 4))])]
+scheduler = Scheduler(triggers, players=[player])
+current   = [None]              # Active trigger, in a list so run_pass can change it
+
+# One pass of the main loop, as in the examples. Each pass starts on a new
+# millisecond, so rate limited actions see time pass as they would in a show
+def run_pass():
+    last = clock.now
+    while ticks_ms() == last:
+        pass
+    clock.tick()
+    trigger = current[0]
+    if trigger is not None and not trigger.play():
+        trigger.stop()
+        current[0] = None
+    player.poll()
+    for i in range(len(triggers)):
+        triggers[i].do_update()
+    for i in range(len(triggers)):
+        if triggers[i].check_triggered():
+            triggers[i].respond_to_trigger()
+            current[0] = triggers[i] if triggers[i].is_active() else None
+    scheduler.next_deadline()
+
+# Heap allocations per pass over PASSES passes, a description of where they came
+# from, and the number of servo updates measured
+def measure():
+    for i in range(WARMUP):
+        run_pass()
+    log.flush()                 # Printing the start up messages allocates
+    if tracemalloc is None:
+        gc.collect()
+        gc.disable()
+        moved  = servo.action_count
+        before = gc.mem_alloc()
+        for i in range(PASSES):
+            run_pass()
+        allocated = gc.mem_alloc() - before
+        gc.enable()
+        return allocated / PASSES, "", servo.action_count - moved
+    lib_only = [tracemalloc.Filter(True, os.path.join(LIB_DIR, "*"))]
+    tracemalloc.start()
+    for i in range(WARMUP):     # Values replaced every pass are now traced in both snapshots
+        run_pass()
+    before = tracemalloc.take_snapshot().filter_traces(lib_only)
+    moved  = servo.action_count
+    for i in range(PASSES):
+        run_pass()
+    after = tracemalloc.take_snapshot().filter_traces(lib_only)
+    tracemalloc.stop()
+    growth = [stat for stat in after.compare_to(before, "lineno") if stat.count_diff > NOISE_BLOCKS]
+    allocated = sum(stat.size_diff for stat in growth)
+    return allocated / PASSES, "\n".join("    " + str(stat) for stat in growth[:5]), servo.action_count - moved
+
+def main():
+    failed = False
+    unmeasured = False
+    phases = (("idle", None), ("trigger active", triggers[0]))
+    for name, trigger in phases:
+        if trigger is not None:
+            trigger.pressed = True
+        per_pass, where, moved = measure()
+        print("%-16s %8.2f bytes/pass, %d servo updates" % (name, per_pass, moved))
+        if per_pass > 0:
+            failed = True
+            if where:
+                print(where)
+        if trigger is not None and moved == 0:
+            unmeasured = True
+    if failed:
+        print("FAIL: the main loop allocates in steady state")
+    if unmeasured:
+        print("FAIL: the servo never moved, so its update was not measured")
+    if failed or unmeasured:
+        sys.exit(1)
+    if tracemalloc is not None:
+        print("INCONCLUSIVE: no growth, but short-lived allocations can only be counted on the board")
+        print("or the MicroPython unix port")
+        sys.exit(2)
+    print("OK: no allocations in steady state")
+
+main()
@@ -0,0 +1,125 @@
+# ----------------------------------------------------------------------------
+# Builds a sound manifest for a DY-SV5W SD card. Run on a computer with the SD
+# card mounted, then copy the manifest file to the CIRCUITPY drive:
+#
+#   python tools/build_sound_manifest.py /media/SDCARD -o sounds.dym
+#
+# The manifest lists every .mp3/.wav file on the card with the track number the
+# player gives it, its path, its folder and its duration, so actions can look
+# durations up at run time (see lib/sound_manifest.py) instead of having them
+# typed in by hand. The module numbers files in the order they were copied to
+# the card; by default this tool assumes that matches alphabetical path order
+# (true for cards filled with numbered file names like 00001.mp3). Use
+# --order directory to number files in the card's directory order instead.
+#
+# MP3 durations are measured by walking the MPEG frame headers, which handles
+# both constant and variable bit rate files. WAV durations come from the header.
+#
+# License: MIT
+# ----------------------------------------------------------------------------
+
+import argparse
+import os
+import struct
+import sys
+import wave
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib"))
+
+from sound_manifest import HEADER_FORMAT, RECORD_FORMAT, MAGIC, VERSION, PATH_SIZE
+
+AUDIO_EXTENSIONS = (".mp3", ".wav")
+
+# Bit rates (kbit/s) by [mpeg1][layer3][index]. Only Layer III is used by the module
+_BITRATES = { True:  (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+              False: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160) }
+_SAMPLE_RATES = { 3: (44100, 48000, 32000),     # MPEG 1
+                  2: (22050, 24000, 16000),     # MPEG 2
+                  0: (11025, 12000, 8000) }     # MPEG 2.5
+
+def mp3_duration(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    pos = 0
+    if data[0:3] == b"ID3":                     # Skip an ID3v2 tag
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        pos = 10 + size
+    seconds = 0.0
+    while pos + 4 <= len(data):
+        if data[pos] != 0xff or (data[pos + 1] & 0xe0) != 0xe0:
+            pos = pos + 1
+            continue
+        version  = (data[pos + 1] >> 3) & 0x03
+        layer    = (data[pos + 1] >> 1) & 0x03
+        bitrate  = (data[pos + 2] >> 4) & 0x0f
+        rate     = (data[pos + 2] >> 2) & 0x03
+        padding  = (data[pos + 2] >> 1) & 0x01
+        if version == 1 or layer != 1 or bitrate in (0, 15) or rate == 3:
+            pos = pos + 1                       # Not a Layer III frame header
+            continue
+        mpeg1       = version == 3
+        sample_rate = _SAMPLE_RATES[version][rate]
+        samples     = 1152 if mpeg1 else 576
+        length      = (samples // 8) * _BITRATES[mpeg1][bitrate] * 1000 // sample_rate + padding
+        seconds     = seconds + samples / sample_rate
+        pos         = pos + length
+    return seconds
+
+def wav_duration(path):
+    with wave.open(path, "rb") as w:
+        return w.getnframes() / w.getframerate()
+
+def duration(path):
+    if path.lower().endswith(".wav"):
+        return wav_duration(path)
+    return mp3_duration(path)
+
+# --- audio files on the card as paths relative to the root, in track order -----
+def scan(root, order):
+    found = []
+    def walk(folder):
+        names = os.listdir(folder)
+        if order == "name":
+            names.sort(key=str.upper)
+        for name in names:
+            full = os.path.join(folder, name)
+            if os.path.isdir(full):
+                walk(full)
+            elif name.lower().endswith(AUDIO_EXTENSIONS):
+                found.append(full)
+    walk(root)
+    return found
+
+def build(root, output, order):
+    files   = scan(root, order)
+    folders = []
+    records = []
+    for track, full in enumerate(files, 1):
+        rel    = "/" + os.path.relpath(full, root).replace(os.sep, "/").upper()
+        folder = rel[0:rel.rfind("/") + 1]
+        if folder not in folders:
+            folders.append(folder)
+        encoded = rel.encode()
+        if len(encoded) > PATH_SIZE:
+            raise ValueError("path too long for manifest: " + rel)
+        ms = int(round(duration(full) * 1000))
+        records.append(struct.pack(RECORD_FORMAT, track, folders.index(folder), ms, encoded))
+        print("%5d  %8.3f s  %s" % (track, ms / 1000, rel))
+    with open(output, "wb") as f:
+        f.write(struct.pack(HEADER_FORMAT, MAGIC, VERSION, struct.calcsize(RECORD_FORMAT),
+                            len(records), len(folders)))
+        for record in records:
+            f.write(record)
+    print("wrote %d tracks in %d folders to %s" % (len(records), len(folders), output))
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a DY-SV5W sound manifest from an SD card")
+    parser.add_argument("root", help="mount point of the SD card")
+    parser.add_argument("-o", "--output", default="sounds.dym", help="manifest file to write")
+    parser.add_argument("--order", choices=("name", "directory"), default="name",
+                        help="number tracks by path name or by directory order on the card")
+    args = parser.parse_args()
+    build(args.root, args.output, args.order)
+
+if __name__ == "__main__":
+    main()
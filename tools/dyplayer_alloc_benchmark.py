@@ -0,0 +1,42 @@
+# ----------------------------------------------------------------------------
+# Microbenchmark for the DYPlayer command encoder. Copy to the board (with the
+# lib folder) and run it as code.py. Sends every parameterised command many
+# times to a UART stand-in that discards the data, and reports the heap bytes
+# allocated per command, which should be zero.
+# ----------------------------------------------------------------------------
+
+import gc
+import time
+
+from dyplayer import DYPlayer, PlayMode
+
+# Accepts writes and throws them away, so only the encoder is measured
+class NullUart():
+    in_waiting = 0
+
+    def write(self, buf):
+        return len(buf)
+
+ITERATIONS = 1000
+
+player = DYPlayer(uart=NullUart())
+
+commands = [ ("playByNumber",   lambda i: player.playByNumber(i)),
+             ("selectByNumber", lambda i: player.selectByNumber(i)),
+             ("setVolume",      lambda i: player.setVolume(i & 0x1f)),
+             ("setCycleMode",   lambda i: player.setCycleMode(PlayMode.ONE_OFF)),
+             ("setCycleTimes",  lambda i: player.setCycleTimes(i)),
+             ("stop",           lambda i: player.stop()) ]
+
+for name, cmd in commands:
+    cmd(1)                      # warm up so one-time allocations are not counted
+    gc.collect()
+    gc.disable()
+    before = gc.mem_alloc()
+    start  = time.monotonic()
+    for i in range(ITERATIONS):
+        cmd(i)
+    elapsed = time.monotonic() - start
+    allocated = gc.mem_alloc() - before
+    gc.enable()
+    print("%-16s %6.1f us/cmd  %d bytes/cmd" % (name, 1e6*elapsed/ITERATIONS, allocated // ITERATIONS))
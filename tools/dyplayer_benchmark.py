@@ -0,0 +1,72 @@
+# ----------------------------------------------------------------------------
+# Throughput and latency benchmark for the DYPlayer driver, run against the
+# software DY-SV5W emulator so it needs no hardware:
+#
+#   python tools/dyplayer_benchmark.py
+#
+# Reports how many commands of a burst reach the module (the rest are dropped
+# by the module or coalesced by the driver), how long the burst takes to drain,
+# and the round trip time of non-blocking status queries. Exits with an error
+# if any command reaches the module inside its latency window.
+# ----------------------------------------------------------------------------
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib"))
+
+from dyplayer import DYPlayer
+from dyplayer_emulator import DYPlayerEmulator
+
+LOOP_PERIOD = 0.002         # Seconds per simulated main loop tick
+
+def run_until(player, done, timeout=10.0):
+    start = time.monotonic()
+    while not done() and time.monotonic() - start < timeout:
+        player.poll()
+        time.sleep(LOOP_PERIOD)
+    return time.monotonic() - start
+
+def burst(player, sim, num_groups):
+    # What switching ActionGroups rapidly sends: stop, play, volume per group
+    start = time.monotonic()
+    for i in range(num_groups):
+        player.stop()
+        player.playByNumber(i % sim.num_songs + 1)
+        player.setVolume(10 + i % 10)
+        player.poll()
+    drain = run_until(player, lambda: player._tx_count == 0)
+    return 3 * num_groups, len(sim.commands), time.monotonic() - start, drain
+
+def query_latency(player, num_queries):
+    times = []
+    for i in range(num_queries):
+        query = player.queryPlayStateAsync()
+        start = time.monotonic()
+        run_until(player, lambda: query.done)
+        if not query.timed_out:
+            times.append(time.monotonic() - start)
+    return times
+
+def main():
+    sim    = DYPlayerEmulator(num_songs=20)
+    player = DYPlayer(uart=sim)
+
+    sent, accepted, elapsed, drain = burst(player, sim, 20)
+    print("burst:   %d commands issued, %d reached the module, %d dropped by it, %.3f s total (%.3f s draining)"
+          % (sent, accepted, sim.dropped, elapsed, drain))
+
+    times = query_latency(player, 20)
+    if times:
+        print("queries: %d/20 answered, mean %.1f ms, max %.1f ms"
+              % (len(times), 1000*sum(times)/len(times), 1000*max(times)))
+    else:
+        print("queries: none answered")
+
+    if sim.dropped:
+        print("FAIL: the module dropped commands sent inside its latency window")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# ----------------------------------------------------------------------------
+# Measures track transitions of an ActionSoundSequence against the software
+# DY-SV5W emulator, so it needs no hardware:
+#
+#   python tools/sequence_gap_benchmark.py [--tick 0.02] [--target 0.02]
+#                                          [--start-delay 0.03] [--no-prearm] [--select-stops]
+#
+# For every track switch it reports the silent gap between tracks and how late
+# the next track started compared to its planned time. Exits with an error if
+# any gap is longer than the target, or any track starts more than the target
+# plus one tick off its planned time. A longer --tick simulates a slow main loop.
+#
+# The emulated module takes --start-delay seconds to start a track it hasn't
+# opened yet, and the player keeps busy meanwhile, as in a show: background
+# status polls, a volume change every few ticks and a query now and then. The
+# sequence is run twice: once on an idle player, and once started in the same
+# tick the player is stopped, as when a trigger is pressed again while active.
+# ----------------------------------------------------------------------------
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib"))
+
+from dyplayer import DYPlayer
+from dyplayer_emulator import DYPlayerEmulator
+from action_object.action_sound_sequence import ActionSoundSequence
+from tick_clock import clock, ticks_ms
+
+# Runs the sequence once and returns a list of what went wrong. With restart, the
+# player is playing another track and is stopped in the same tick the sequence
+# starts, as when a trigger is pressed again while active
+def run(args, restart):
+    tracks    = [2, 4, 6, 3, 5]
+    durations = [0.6, 0.45, 0.7, 0.5, 0.55]
+    sim       = DYPlayerEmulator(num_songs=10, default_duration=5.0, response_latency=0.02,
+                                 start_delay=args.start_delay, select_stops=args.select_stops)
+    player    = DYPlayer(uart=sim, status_interval=0.1)
+    sequence  = ActionSoundSequence(player, tracks, durations, prearm=not args.no_prearm)
+
+    if restart:
+        player.playByNumber(9)
+        begin = time.monotonic()
+        while time.monotonic() - begin < 0.3 or player._tx_count or not player._window_open(ticks_ms()):
+            player.poll()
+            time.sleep(0.001)
+        player.stop()                           # Goes out at once, so the first play must wait a window
+    begin = time.monotonic()
+    clock.tick()
+    sequence.start_action()
+    ticks = 0
+    while sequence.is_active() or player._tx_count:
+        clock.tick()
+        player.poll()
+        if sequence.is_active():
+            sequence.do_action()
+            ticks = ticks + 1
+            if ticks % 3 == 0:                  # Background traffic
+                player.setVolume(15 + ticks % 5)
+            if ticks % 10 == 0:
+                player.queryNumSongsAsync()
+        time.sleep(args.tick)
+
+    played  = [song for when, event, song in sim.events if event == "start" and when >= begin]
+    starts  = [when for when, event, song in sim.events if event == "start" and when >= begin]
+    # The schedule starts when the sequence's first play reaches the module
+    first   = [when for when, op in sim.commands if when >= begin and op == DYPlayer.CMD_PLAY_BY_NUMBER[1]][0]
+    planned = [first + sum(durations[0:i]) for i in range(len(durations))]
+    gaps    = sim.gaps()[-(len(starts) - 1):] if len(starts) > 1 else []
+    late    = [starts[i] - planned[i] for i in range(1, len(starts))]
+    print("%s:" % ("stop, then start in the same tick" if restart else "start on an idle player"))
+    for i in range(len(late)):
+        print("  track %d -> %d: gap %5.1f ms, started %+6.1f ms from plan"
+              % (played[i], played[i + 1], 1000*gaps[i], 1000*late[i]))
+    failures = []
+    if played != tracks:
+        failures.append("tracks played %s instead of %s" % (played, tracks))
+        return failures
+    worst_error = max(abs(l) for l in late)
+    print("  worst gap %.1f ms, worst timing error %.1f ms" % (1000*max(gaps), 1000*worst_error))
+    if max(gaps) > args.target:
+        failures.append("gap above target of %.1f ms" % (1000*args.target))
+    if worst_error > args.target + args.tick:
+        failures.append("timing error above target plus one tick (%.1f ms)" % (1000*(args.target + args.tick)))
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure ActionSoundSequence track switch gaps")
+    parser.add_argument("--tick", type=float, default=0.02, help="main loop period in seconds")
+    parser.add_argument("--target", type=float, default=0.02, help="largest acceptable gap in seconds")
+    parser.add_argument("--start-delay", type=float, default=0.03,
+                        help="seconds the module takes to start a track it hasn't opened")
+    parser.add_argument("--no-prearm", action="store_true", help="don't select each track ahead")
+    parser.add_argument("--select-stops", action="store_true",
+                        help="emulate a module that stops playing when a track is selected")
+    args = parser.parse_args()
+
+    failures = run(args, False) + run(args, True)
+    for failure in failures:
+        print("FAIL:", failure)
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()